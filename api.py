@@ -1,21 +1,35 @@
 import os
-import random
+import asyncio
+import contextlib
 import time
 from typing import *
+from array import array
 import json
 from log import *
 from config import *
+from storage import Storage, SharedUsers, write_atomic
+from scheduler import Deadlines, ExpiringDict
+from ranking import RankIndex
+from usertable import UserTable
+import words
+import utils
 
 
 # user
 
 class User:
+    __slots__ = (
+        'id', 'started_playing',
+        'xp', 'xp_guessed', 'xp_explained', 'moonrocks',
+        'words_guessed', 'words_explained', 'words_chosen',
+        'likes', 'dislikes', 'hidden',
+    )
+
     def __init__(self, id:str, data:dict):
         '''
         Represents a user in the bot.
         '''
         self.id: int = int(id)
-        self.data: dict = data
 
         self.started_playing: int = data.get('started_playing',time.time())
 
@@ -31,6 +45,9 @@ class User:
         self.likes: int = data.get('likes', 0)
         self.dislikes: int = data.get('dislikes', 0)
 
+        # hidden from global leaderboards
+        self.hidden: bool = bool(data.get('hidden', False))
+
 
     def to_dict(self) -> dict:
         return {
@@ -44,6 +61,7 @@ class User:
             "started_playing": self.started_playing,
             "likes": self.likes,
             "dislikes": self.dislikes,
+            "hidden": self.hidden,
         }
 
 
@@ -61,7 +79,24 @@ class Language:
         self.file: str = LANG_FOLDER+data['file']
         self.emoji: str = data['emoji']
 
-        self.reload_file()
+        # the file is only loaded when the language is first used
+        self.store: "words.WordStore | None" = None
+        self.last_used: float = 0
+
+
+    @property
+    def loaded(self) -> bool:
+        return self.store != None
+
+
+    @property
+    def size(self) -> int:
+        '''
+        Memory taken by the loaded word index in bytes.
+        '''
+        if self.store == None:
+            return 0
+        return len(self.store.map)
 
     
     def reload_file(self):
@@ -70,30 +105,59 @@ class Language:
         '''
         log(f'Loading language {self.key}...', 'api',)
 
-        with open(self.file, encoding='utf-8') as f:
-            self.raw: str = f.read()
-        
-        # getting word list
-        log(f'[{self.key}] Parsing words...', 'api',)
+        # the index is rebuilt if the file changed
+        self.store: words.WordStore = words.open_index(self.file)
 
-        self.words: Set[str] = self.raw.split('\n')
-        self.words = {i.lower().replace('ё','е') for i in self.words if i != ''}
+        # words are only decoded when picked
+        self.words: Sequence[str] = self.store.words
         self.word_amount: int = len(self.words)
 
         # filtered list only with words without symbols
-        log(f'[{self.key}] Filtering words...', 'api',)
-
-        self.filtered_words: Set[str] = {
-            i for i in self.words if i.isalpha()
-        }
+        self.filtered_words: Sequence[str] = self.store.filtered_words
         self.filtered_word_amount: int = len(self.filtered_words)
 
         log(f'Language {self.key} loaded', 'api', level=SUCCESS,)
 
 
+    def get_words(
+        self, filtered:bool,
+        min_length:"int | None"=None,
+        max_length:"int | None"=None
+    ) -> Sequence[str]:
+        '''
+        Returns the word list, optionally only with words
+        of length from `min_length` to `max_length` inclusive.
+        '''
+        if min_length == None and max_length == None:
+            return self.filtered_words if filtered else self.words
+
+        return self.store.get_by_length(
+            filtered,
+            min_length if min_length != None else 0,
+            max_length if max_length != None else self.store.max_length
+        )
+
+
+    def unload(self):
+        '''
+        Frees the loaded words.
+        The language gets loaded again when it's used.
+        '''
+        self.store = None
+        self.words = None
+        self.filtered_words = None
+
+        log(f'Language {self.key} unloaded', 'api')
+
+
 # guild
 
 class Guild:
+    __slots__ = (
+        'id', 'total_words_guessed', 'leaderboard', 'ranks',
+        'language', 'filter', 'bags', 'changed_leaders',
+    )
+
     def __init__(
         self, id:str, data:dict,
         default_language:str
@@ -102,16 +166,24 @@ class Guild:
         Represents a Discord guild.
         '''
         self.id: int = int(id)
-        self.data: dict = data
 
         self.total_words_guessed: int = data.get('total_words_guessed',0)
         self.leaderboard: Dict[int, int] = {
             int(key): value for key, value in data.get('leaderboard',{}).items()
         }
+        self.ranks: RankIndex = RankIndex(self.leaderboard.items())
 
         self.language: str = data.get('language',default_language)
         self.filter: bool = data.get('filter',FILTER_SYMBOLS_BY_DEFAULT)
 
+        # words already shown for each language and filter setting
+        self.bags: Dict[str, words.ShuffleBag] = {
+            key: words.ShuffleBag(*value) for key, value in data.get('bags',{}).items()
+        }
+
+        # leaderboard entries not yet written to the journal
+        self.changed_leaders: Set[int] = set()
+
 
     def word_guessed(self, id:int):
         '''
@@ -122,8 +194,31 @@ class Guild:
 
         # adding to leaderboard
         if id not in self.leaderboard:
-            self.leaderboard[id] = 0
-        self.leaderboard[id] += 1
+            self.leaderboard[id] = 1
+            self.ranks.add(id, 1)
+        else:
+            self.leaderboard[id] += 1
+            self.ranks.move(id, self.leaderboard[id]-1, self.leaderboard[id])
+        self.changed_leaders.add(id)
+
+
+    def get_bag(
+        self, language:str, filter:bool,
+        min_length:"int | None"=None,
+        max_length:"int | None"=None
+    ) -> words.ShuffleBag:
+        '''
+        Returns the shuffle bag for the word list.
+        '''
+        key: str = f'{language}:{int(filter)}'
+
+        if min_length != None or max_length != None:
+            key += f':{min_length or 0}-{max_length or ""}'
+
+        if key not in self.bags:
+            self.bags[key] = words.ShuffleBag()
+
+        return self.bags[key]
 
 
     def get_leaderboard(self, amount:int) -> Dict[int, int]:
@@ -131,53 +226,89 @@ class Guild:
         Returns a sorted leaderboard with the specified amount
         of entries.
         '''
-        # sorting the leaderboard by value
-        _leaderboard = dict(sorted(
-            self.leaderboard.items(),
-            key=lambda x: x[1],
-            reverse=True
-        ))
+        return dict(self.ranks.get_top(amount))
 
-        # getting the first couple of values
-        _leaderboard = dict(list(_leaderboard.items())[:amount])
 
-        return _leaderboard
+    def get_rank(self, id:int) -> "int | None":
+        '''
+        Returns the user's place on the leaderboard
+        or None if the user hasn't guessed anything.
+        '''
+        if id not in self.leaderboard:
+            return None
+        return self.ranks.get_rank(self.leaderboard[id])
 
 
     def to_dict(self) -> dict:
         return {
             "total_words_guessed": self.total_words_guessed,
-            "leaderboard": self.leaderboard,
+            "leaderboard": dict(self.leaderboard),
             "filter": self.filter,
-            "language": self.language
+            "language": self.language,
+            "bags": {key: value.to_list() for key, value in self.bags.items()}
         }
 
 
+    def to_record(self) -> dict:
+        '''
+        Returns a journal record with the guild settings and only
+        the leaderboard entries changed since the last record.
+        '''
+        record = {
+            "g": self.id,
+            "d": {
+                "total_words_guessed": self.total_words_guessed,
+                "filter": self.filter,
+                "language": self.language,
+                "bags": {key: value.to_list() for key, value in self.bags.items()}
+            },
+            "l": {i: self.leaderboard[i] for i in self.changed_leaders}
+        }
+        self.changed_leaders.clear()
+
+        return record
+
+
 # game
 
 class Game:
+    __slots__ = (
+        'channel_id', 'message_id', 'starter_id', 'starter_name',
+        'word', 'moonrocks', 'until',
+    )
+
     def __init__(
         self, channel_id:int,
         message_id:int, starter_id:int,
-        word:str, starter_name:str
+        word:str, starter_name:str,
+        until:"float | None"=None
     ):
         self.channel_id: int = channel_id
         self.message_id: int = message_id
         self.starter_id: int = starter_id
         self.starter_name: str = starter_name
-        self.word: str = word
+        self.word: str = utils.normalize(word) # normalized to compare guesses
         self.moonrocks: int = max(0,int(len(word)/5)-1)
-        self.until: float = time.time()+GAME_LENGTH
+        self.until: float = time.time()+GAME_LENGTH if until == None else until
 
 
     def change_word(self, new_word:str):
-        self.word: str = new_word
+        self.word: str = utils.normalize(new_word)
         self.moonrocks: int = max(0,int(len(new_word)/5)-1)
 
 
+    def to_list(self) -> list:
+        return [
+            self.channel_id, self.message_id, self.starter_id,
+            self.word, self.starter_name, self.until
+        ]
+
+
 # restriction
 
 class Restriction:
+    __slots__ = ('channel_id', 'guesser_id', 'until')
+
     def __init__(
         self, channel_id:int, guesser_id:int, until:float
     ):
@@ -186,15 +317,22 @@ class Restriction:
         self.until: float = until
 
 
+    def to_list(self) -> list:
+        return [self.channel_id, self.guesser_id, self.until]
+
+
 # reaction
 
 class Reaction:
+    __slots__ = ('message_id', 'explainer_id', 'likes', 'dislikes')
+
     def __init__(self, message_id:int, explainer_id:int):
         self.message_id: int = message_id
         self.explainer_id: int = explainer_id
 
-        self.likes: List[int] = []
-        self.dislikes: List[int] = []
+        # dicts work as sets that keep the order users voted in
+        self.likes: Dict[int, None] = {}
+        self.dislikes: Dict[int, None] = {}
 
     
     def get_user(self, id:int) -> int:
@@ -211,25 +349,49 @@ class Reaction:
 
 # manager
 
+# user stats with a global leaderboard
+RANKED_STATS: List[str] = ['xp', 'moonrocks', 'words_guessed']
+
+
 class Manager:
     def __init__(
         self,
         data_file_path:str,
-        users_file_path:str
+        storage:Storage,
+        state_file_path:str=STATE_FILE,
+        shared_users:"SharedUsers | None"=None
     ):
         '''
         Manages all games, users, languages and more.
+
+        If `shared_users` is passed, users are kept there instead
+        of the storage, so that cluster workers share them.
         '''
         self.data_file: str = data_file_path
-        self.users_file: str = users_file_path
+        self.state_file: str = state_file_path
+        self.storage: Storage = storage
+        self.shared_users: "SharedUsers | None" = shared_users
 
         self.games: Dict[int, Game] = {}
         self.restrictions: Dict[int, Restriction] = {}
 
-        self.reactions: Dict[int, Reaction] = {}
+        # when games and restrictions expire,
+        # keyed by ('game' or 'restriction', channel ID)
+        self.deadlines = Deadlines()
+
+        # finished games can only be liked or disliked for a while
+        self.reactions: ExpiringDict = ExpiringDict(GAME_LENGTH, REACTION_LIMIT)
+
+        # write-behind state
+        self.dirty_users: Set[int] = set()
+        self.dirty_guilds: Set[int] = set()
+        self.pending_changes: int = 0
+        self.write_task: "asyncio.Task | None" = None
+        self.write_again: bool = False
 
         self.load_data()
         self.load_users()
+        self.load_state()
 
 
     def new_db(self):
@@ -237,10 +399,11 @@ class Manager:
         Completely overwrites the current user data
         and creates a new database from scratch.
         '''
-        self.users: Dict[int, User] = {}
+        self.users: "Dict[int, User] | UserTable" = self.new_users({})
         self.guilds: Dict[int, Guild] = {}
+        self.build_ranks()
 
-        self.commit()
+        self.compact()
         log('Created new database', 'api', level=SUCCESS)
 
 
@@ -248,13 +411,7 @@ class Manager:
         '''
         Copies the database into a backup file.
         '''
-        with open(self.users_file, encoding='utf8') as f:
-            data = f.read()
-
-        with open(f'{self.users_file}.bak', 'w', encoding='utf8') as f:
-            f.write(data)
-
-        log(f'Cloned database into {self.users_file}.bak', 'api', level=SUCCESS)
+        self.storage.backup()
 
 
     def load_data(self):
@@ -271,6 +428,9 @@ class Manager:
         self.default_language: str = data['default_language']
         self.languages: Dict[str, Language] = {}
 
+        # loaded languages, least recently used first
+        self.loaded_languages: Dict[str, Language] = {}
+
         for key, lang in data['languages'].items():
             self.languages[key] = Language(key, lang)
 
@@ -279,30 +439,39 @@ class Manager:
 
     def load_users(self):
         '''
-        Reloads user.json file.
+        Reloads the database.
         '''
         log('Loading database...', 'api')
 
-        # checking if file exists
-        if not os.path.exists(self.users_file):
-            self.new_db()
-            return
-        
-        # trying to open the file
+        # anything unwritten belongs to the old data
+        self.dirty_users.clear()
+        self.dirty_guilds.clear()
+        self.pending_changes = 0
+
+        # trying to open the database
         try:
-            with open(self.users_file, encoding='utf-8') as f:
-                raw: dict = json.load(f)
+            raw: "dict | None" = self.storage.load()
 
         # creating the database if failed
         except Exception as e:
             log(f'Failed opening the database: {e}', 'api', level=ERROR)
+
+            # other cluster workers still use it
+            if self.storage.shared:
+                raise
+
             self.clone_db()
             self.new_db()
             return
+
+        # creating the database if there's none
+        if raw == None:
+            self.new_db()
+            return
         
         # parsing users
         log('Parsing users...', 'api')
-        self.users = {int(id): User(id, data) for id, data in raw['users'].items()}
+        self.users = self.new_users(raw['users'])
         
         # parsing guilds
         log('Parsing guilds...', 'api')
@@ -310,33 +479,427 @@ class Manager:
             id, data, self.default_language
         ) for id, data in raw['guilds'].items()}
 
+        self.build_ranks()
+
         log('Database loaded', 'api', level=SUCCESS)
 
 
+    def new_users(
+        self, raw:Dict[str, dict]
+    ) -> "Dict[int, User] | UserTable | SharedUsers":
+        '''
+        Parses users into the store set in the config.
+        '''
+        if self.shared_users != None:
+            return self.shared_users
+
+        if USER_STORE != 'columns':
+            return {int(id): User(id, data) for id, data in raw.items()}
+
+        users = UserTable()
+        for id, data in raw.items():
+            users[int(id)] = User(id, data)
+
+        return users
+
+
+    def build_ranks(self):
+        '''
+        Builds global leaderboards from all users.
+
+        Shared users are ranked by the database and users
+        in columns are ranked from the columns if `SCAN_GLOBAL_RANKS` is set.
+        '''
+        if self.shared_users != None or self.scan_ranks():
+            self.global_ranks = {}
+            return
+
+        if isinstance(self.users, UserTable):
+            columns: Dict[str, array] = self.users.columns
+            self.global_ranks: Dict[str, RankIndex] = {
+                stat: RankIndex(
+                    (id, value) for id, value, hidden
+                    in zip(self.users.ids, columns[stat], columns['hidden'])
+                    if not hidden
+                ) for stat in RANKED_STATS
+            }
+            return
+
+        self.global_ranks = {
+            stat: RankIndex(
+                (id, getattr(user, stat)) for id, user in self.users.items()
+                if not user.hidden
+            ) for stat in RANKED_STATS
+        }
+
+
+    def scan_ranks(self) -> bool:
+        '''
+        Returns True if global leaderboards are counted
+        from user columns instead of being kept sorted.
+        '''
+        return SCAN_GLOBAL_RANKS and isinstance(self.users, UserTable)
+
+
+    def change_stat(self, user:User, stat:str, amount:int):
+        '''
+        Adds the amount to the user's stat, moving the user
+        on the global leaderboard of the stat if there is one.
+
+        Ranked stats should only be changed through this,
+        since leaderboards don't keep their own copy of scores.
+        '''
+        old: int = getattr(user, stat)
+        setattr(user, stat, old+amount)
+
+        if stat in self.global_ranks and not user.hidden:
+            self.global_ranks[stat].move(user.id, old, old+amount)
+
+
+    def batch_users(self) -> ContextManager[None]:
+        '''
+        Returns a context in which changes of users are written together.
+
+        Shared users are written in one transaction at its end,
+        which raises if the database is busy, so anything else
+        should only be changed after it.
+        Other users are written by the next flush anyway.
+        '''
+        if self.shared_users == None:
+            return contextlib.nullcontext()
+
+        return self.shared_users.batch()
+
+
+    def mark_user(self, *ids:int):
+        '''
+        Marks users as modified so they get written on the next flush.
+
+        Shared users are written right away, so they're not marked.
+        '''
+        if self.shared_users != None:
+            return
+
+        self.dirty_users.update(ids)
+
+
+    def mark_guild(self, *ids:int):
+        '''
+        Marks guilds as modified so they get written on the next flush.
+        '''
+        self.dirty_guilds.update(ids)
+
+
     def commit(self):
         '''
-        Dumps user data into a file.
+        Registers a change in user data.
+
+        The data is only written right away if enough changes
+        piled up, otherwise it's left for the background flusher.
+        '''
+        self.pending_changes += 1
+
+        if self.pending_changes < COMMIT_BATCH_SIZE:
+            return
+
+        # writing in the background if running inside the bot
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+        else:
+            self.request_flush()
+
+
+    def get_records(self) -> List[dict]:
+        '''
+        Returns the records of users and guilds modified
+        since the last call and clears the modified lists.
+        '''
+        self.pending_changes = 0
+
+        records: List[dict] = [
+            {"u": i, "d": self.users[i].to_dict()} for i in self.dirty_users
+        ]
+        records.extend([
+            self.guilds[i].to_record() for i in self.dirty_guilds
+        ])
+
+        self.dirty_users.clear()
+        self.dirty_guilds.clear()
+
+        return records
+
+
+    def flush(self):
+        '''
+        Writes the users and guilds modified since the last flush.
+        Compacts the storage if needed.
+        '''
+        records: List[dict] = self.get_records()
+
+        try:
+            if records:
+                self.storage.write(records)
+        except:
+            self.mark_records(records)
+            raise
+
+        if self.storage.needs_compaction():
+            self.compact()
+
+
+    def request_flush(self) -> asyncio.Task:
+        '''
+        Starts writing the modified data in a worker thread.
+
+        If a write is already in progress, another one is done
+        right after it, so there's at most one write at a time.
+        Returns the task doing the writing.
+        '''
+        if self.write_task != None and not self.write_task.done():
+            self.write_again = True
+            return self.write_task
+
+        self.write_task = asyncio.create_task(self.write_in_background())
+        return self.write_task
+
+
+    async def flush_async(self):
+        '''
+        Writes the modified data in a worker thread
+        and waits until it's written.
+        '''
+        await self.request_flush()
+
+
+    async def write_in_background(self):
+        '''
+        Writes the modified data until there's nothing left.
+        '''
+        self.write_again = True
+
+        while self.write_again:
+            self.write_again = False
+
+            # the snapshot is taken here so it's consistent,
+            # only the writing itself goes to the thread
+            records: List[dict] = self.get_records()
+
+            try:
+                if records:
+                    await asyncio.to_thread(self.storage.write, records)
+
+            # trying again on the next flush
+            except Exception as e:
+                log(f'Failed writing the database: {e}', 'api', level=ERROR)
+                self.mark_records(records)
+                return
+
+            # compaction replaces the data at once,
+            # so a failed one leaves the old data in place
+            try:
+                if self.storage.needs_compaction():
+                    await asyncio.to_thread(self.storage.compact, self.to_dict())
+            except Exception as e:
+                log(f'Failed compacting the database: {e}', 'api', level=ERROR)
+
+
+    def mark_records(self, records:List[dict]):
+        '''
+        Marks users and guilds of records that failed to be written
+        as modified again, so they're written on the next flush.
+        '''
+        for record in records:
+            if 'u' in record:
+                self.dirty_users.add(record['u'])
+
+            elif record['g'] in self.guilds:
+                self.dirty_guilds.add(record['g'])
+                self.guilds[record['g']].changed_leaders.update(record['l'])
+
+
+    def compact(self):
+        '''
+        Replaces all stored data with the current data.
+        '''
+        self.storage.compact(self.to_dict())
+
+        self.dirty_users.clear()
+        self.dirty_guilds.clear()
+        self.pending_changes = 0
+
+
+    def get_state(self) -> dict:
+        '''
+        Returns running games, restrictions and reactions
+        in the form they're saved in.
+        '''
+        return {
+            "games": [i.to_list() for i in self.games.values()],
+            "restrictions": [i.to_list() for i in self.restrictions.values()],
+            "reactions": [
+                [r.message_id, r.explainer_id, until, list(r.likes), list(r.dislikes)]
+                for _, until, r in self.reactions.get_items()
+            ]
+        }
+
+
+    def save_state(self):
+        '''
+        Saves running games, restrictions and reactions
+        so they can be continued after a restart.
+        '''
+        self.save_state_file(self.get_state())
+
+
+    def save_state_file(self, state:dict):
+        '''
+        Writes the state returned by `get_state` to the state file.
+        '''
+        write_atomic(self.state_file, json.dumps(state, separators=(',',':')))
+
+
+    async def save_state_async(self):
+        '''
+        Saves running games, restrictions and reactions,
+        writing the file in a worker thread.
+        '''
+        # the state is copied here and only encoded in the thread
+        state: dict = self.get_state()
+
+        try:
+            await asyncio.to_thread(self.save_state_file, state)
+        except Exception as e:
+            log(f'Failed saving state: {e}', 'api', level=ERROR)
+
+
+    def load_state(self):
+        '''
+        Continues games, restrictions and reactions saved
+        before the restart.
+
+        Games that ran out of time while the bot was down
+        expire right away, unless they ended too long ago.
+        '''
+        if not os.path.exists(self.state_file):
+            return
+        
+        log('Loading state...', 'api')
+
+        now: float = time.time()
+        games: List[Game] = []
+        restrictions: List[Restriction] = []
+        reactions: List[Tuple[Reaction, float]] = []
+
+        # everything is parsed before anything is restored,
+        # so a state file of another format is skipped entirely
+        try:
+            with open(self.state_file, encoding='utf-8') as f:
+                state: dict = json.load(f)
+
+            for data in state['games']:
+                game = Game(*data)
+                if game.until+GAME_LENGTH > now:
+                    games.append(game)
+
+            for data in state['restrictions']:
+                restriction = Restriction(*data)
+                if restriction.until > now:
+                    restrictions.append(restriction)
+
+            for message_id, explainer_id, until, likes, dislikes in state['reactions']:
+                reaction = Reaction(message_id, explainer_id)
+                reaction.likes = dict.fromkeys(likes)
+                reaction.dislikes = dict.fromkeys(dislikes)
+                reactions.append((reaction, until))
+
+        except Exception as e:
+            log(f'Failed loading state: {e}', 'api', level=ERROR)
+            return
+
+        deadlines: List[Tuple[tuple, float]] = []
+
+        for game in games:
+            self.games[game.channel_id] = game
+            deadlines.append((('game', game.channel_id), game.until))
+
+        for restriction in restrictions:
+            self.restrictions[restriction.channel_id] = restriction
+            deadlines.append((('restriction', restriction.channel_id), restriction.until))
+
+        self.deadlines.add_many(deadlines)
+
+        for reaction, until in reactions:
+            self.reactions.set_until(reaction.message_id, reaction, until)
+
+        log(
+            'Continued %s games, %s restrictions and %s reactions', 'api',
+            level=SUCCESS, args=(
+                len(self.games), len(self.restrictions), len(self.reactions)
+            )
+        )
+
+
+    def close(self):
+        '''
+        Writes everything that's left, saves the running games
+        and closes the storage.
+        '''
+        self.flush()
+        self.save_state()
+
+        if self.storage.compact_on_close:
+            self.compact()
+
+        self.storage.close()
+
+        if self.shared_users != None:
+            self.shared_users.close()
+
+
+    def get_stats(self) -> Dict[str, int]:
+        '''
+        Returns the sizes of in-memory collections.
         '''
-        data = {
+        return {
+            "users": len(self.users),
+            "guilds": len(self.guilds),
+            "games": len(self.games),
+            "restrictions": len(self.restrictions),
+            "deadlines": len(self.deadlines),
+            "reactions": len(self.reactions),
+            "reaction_evictions": self.reactions.evictions,
+            "loaded_languages": len(self.loaded_languages),
+            "unwritten_users": len(self.dirty_users),
+            "unwritten_guilds": len(self.dirty_guilds),
+        }
+
+
+    def to_dict(self) -> dict:
+        return {
+            # shared users are stored by the cluster, not this manager
             "users": {
                 i: self.users[i].to_dict() for i in self.users
-            },
+            } if self.shared_users == None else {},
             "guilds": {
                 i: self.guilds[i].to_dict() for i in self.guilds
             }
         }
 
-        with open(self.users_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
-
 
     def check_user(self, id:int) -> List[dict]:
         '''
         Checks if user is in database. If not, creates one.
         '''
         if id not in self.users:
-            log(f'Created a new user {id}', 'api')
+            log('Created a new user %s', 'api', args=(id,))
             self.users[id] = User(id, {})
+
+            for stat, ranks in self.global_ranks.items():
+                ranks.add(id, getattr(self.users[id], stat))
+
+            self.mark_user(id)
             self.commit()
 
         # just in case
@@ -352,37 +915,111 @@ class Manager:
         if id in self.guilds:
             return
         
-        log(f'Created a new guild {id}', 'api')
+        log('Created a new guild %s', 'api', args=(id,))
         self.guilds[id] = Guild(id, {}, self.default_language)
+        self.mark_guild(id)
         self.commit()
 
 
-    def get_word(self, guild_id:int) -> str:
+    def get_word(
+        self, guild_id:int,
+        min_length:"int | None"=None,
+        max_length:"int | None"=None
+    ) -> "str | None":
         '''
         Returns a random word from guild's set list.
+
+        If the length is limited, only words of length from `min_length`
+        to `max_length` inclusive are picked. Returns None if there
+        are no such words.
         '''
         # getting guild settings
         self.check_guild(guild_id)
         guild = self.guilds[guild_id]
-        language: Language = self.languages[guild.language]
+        language: Language = self.get_language(guild.language)
         
-        # choosing word
-        word_list: Set[str] = language.filtered_words\
-            if guild.filter else language.words
-        word: str = random.choice(list(word_list))
+        # choosing word, every word is shown once before repeating
+        word_list: Sequence[str] = language.get_words(
+            guild.filter, min_length, max_length
+        )
+        if len(word_list) == 0:
+            return None
+
+        bag: words.ShuffleBag = guild.get_bag(
+            language.key, guild.filter, min_length, max_length
+        )
+        word: str = word_list[bag.draw(len(word_list))]
+
+        self.mark_guild(guild_id)
 
         return word
 
 
+    def get_language(self, key:str) -> Language:
+        '''
+        Returns the language with its words loaded.
+
+        Falls back to the default language if the language
+        doesn't exist or can't be loaded.
+        '''
+        if key not in self.languages:
+            log(f'Unknown language {key}, using {self.default_language}', 'api', level=WARNING)
+            key = self.default_language
+
+        language: Language = self.languages[key]
+        language.last_used = time.time()
+
+        # marking as most recently used
+        if key in self.loaded_languages:
+            self.loaded_languages[key] = self.loaded_languages.pop(key)
+            return language
+        
+        # loading
+        try:
+            language.reload_file()
+        except Exception as e:
+            if key == self.default_language:
+                raise
+
+            log(f'Failed loading language {key}: {e}', 'api', level=ERROR)
+            return self.get_language(self.default_language)
+
+        self.loaded_languages[key] = language
+        self.unload_languages()
+
+        return language
+
+
+    def unload_languages(self):
+        '''
+        Unloads languages that weren't used for a while and the least
+        recently used ones if loaded languages take too much memory.
+        The most recently used language is always kept.
+        '''
+        # idle languages
+        for key, language in list(self.loaded_languages.items())[:-1]:
+            if language.last_used+LANGUAGE_IDLE_TIME <= time.time():
+                self.loaded_languages.pop(key).unload()
+
+        # memory budget
+        total_size: int = sum([i.size for i in self.loaded_languages.values()])
+
+        while total_size > LANGUAGE_MEMORY_BUDGET and len(self.loaded_languages) > 1:
+            language: Language = self.loaded_languages.pop(next(iter(self.loaded_languages)))
+            total_size -= language.size
+            language.unload()
+
+
     def add_xp(self, id:int, amount:int) -> User:
         '''
         Adds XP to the specified user. Returns the user.
         '''
         self.check_user(id)
-        self.users[id].xp += amount
+        self.change_stat(self.users[id], 'xp', amount)
+        self.mark_user(id)
         self.commit()
 
-        log(f'Added {amount} XP to {id}', 'api')
+        log('Added %s XP to %s', 'api', args=(amount, id))
         return self.users[id]
 
 
@@ -391,13 +1028,82 @@ class Manager:
         Adds moonrocks to the specified user. Returns the user.
         '''
         self.check_user(id)
-        self.users[id].moonrocks += amount
+        self.change_stat(self.users[id], 'moonrocks', amount)
+        self.mark_user(id)
         self.commit()
 
-        log(f'Added {amount} moonrocks to {id}', 'api')
+        log('Added %s moonrocks to %s', 'api', args=(amount, id))
         return self.users[id]
     
 
+    def set_hidden(self, id:int, hidden:bool) -> User:
+        '''
+        Hides the user from global leaderboards or shows them again.
+        Returns the user.
+        '''
+        self.check_user(id)
+        user: User = self.users[id]
+
+        if user.hidden != hidden:
+            for stat, ranks in self.global_ranks.items():
+                if hidden:
+                    ranks.remove(id, getattr(user, stat))
+                else:
+                    ranks.add(id, getattr(user, stat))
+
+        user.hidden = hidden
+        self.mark_user(id)
+        self.commit()
+
+        log('Set hidden of %s to %s', 'api', args=(id, hidden))
+        return self.users[id]
+
+
+    def get_global_leaderboard(self, stat:str, amount:int) -> Dict[int, int]:
+        '''
+        Returns the users with the highest value of the stat
+        across all guilds, hidden users excluded.
+        '''
+        if self.shared_users != None:
+            return dict(self.shared_users.get_top(stat, amount))
+
+        if self.scan_ranks():
+            return dict(self.users.get_top(stat, amount, 'hidden'))
+
+        return dict(self.global_ranks[stat].get_top(amount))
+
+
+    def get_global_rank(self, id:int, stat:str) -> "int | None":
+        '''
+        Returns the user's place on the global leaderboard of the stat
+        or None if the user is hidden or didn't play.
+        '''
+        if self.shared_users != None:
+            return self.shared_users.get_rank(id, stat)
+
+        user: "User | None" = self.users.get(id)
+        if user == None or user.hidden:
+            return None
+
+        if self.scan_ranks():
+            return self.users.get_rank(stat, getattr(user, stat), 'hidden')
+
+        return self.global_ranks[stat].get_rank(getattr(user, stat))
+
+
+    async def get_global_rank_async(self, id:int, stat:str) -> "int | None":
+        '''
+        Returns the user's place like `get_global_rank`.
+
+        Places of shared users are counted by the database
+        in a time proportional to the place, so it's done in a worker thread.
+        '''
+        if self.shared_users != None:
+            return await asyncio.to_thread(self.shared_users.get_rank, id, stat)
+
+        return self.get_global_rank(id, stat)
+
+
     def transfer_moonrocks(
         self, from_id:int, to_id:int, amount:str
     ) -> "int":
@@ -434,17 +1140,29 @@ class Manager:
             return 3, None
         
         # transferring
-        self.users[from_id].moonrocks -= amount
-        self.users[to_id].moonrocks += amount
+        if self.shared_users != None:
+            # another worker may have spent them in the meantime
+            if not self.shared_users.transfer(from_id, to_id, 'moonrocks', amount):
+                return 3, None
+        else:
+            self.change_stat(self.users[from_id], 'moonrocks', -amount)
+            self.change_stat(self.users[to_id], 'moonrocks', amount)
+        self.mark_user(from_id, to_id)
         self.commit()
 
-        log(f'Transferred {amount} moonrocks from {from_id} to {to_id}', 'api')
+        log(
+            'Transferred %s moonrocks from %s to %s', 'api',
+            args=(amount, from_id, to_id)
+        )
         return 0, amount
     
 
-    def like(self, game_id:int, user_id:int) -> "int | None":
+    def like(
+        self, game_id:int, user_id:int
+    ) -> "Tuple[int | None, Reaction | None]":
         '''
-        Returns None if no game found.
+        Returns the state and the game's reaction manager.
+        The state is None if no game found.
 
         0 if liked successfully.
         1 if already liked.
@@ -453,32 +1171,40 @@ class Manager:
         '''
         self.check_user(user_id)
 
-        if game_id not in self.reactions:
-            return None
-        
-        r = self.reactions[game_id]
+        r: "Reaction | None" = self.reactions.get(game_id)
+        if r == None:
+            return None, None
 
         # checking if liked own explanation
         if r.explainer_id == user_id:
-            return 3
+            return 3, r
 
         state = r.get_user(user_id)
 
         # liking
         if state == 0:
-            r.likes.append(user_id)
-            self.users[r.explainer_id].likes += 1
-            self.commit()
-            # adding xp to author
-            log(f'{user_id} liked {game_id}, +1 XP to {r.explainer_id}', 'api')
-            self.add_xp(r.explainer_id, 1)
-
-        return state 
+            with self.batch_users():
+                self.users[r.explainer_id].likes += 1
+                self.mark_user(r.explainer_id)
+                self.commit()
+                # adding xp to author
+                self.add_xp(r.explainer_id, 1)
+
+            r.likes[user_id] = None
+            log(
+                '%s liked %s, +1 XP to %s', 'api',
+                args=(user_id, game_id, r.explainer_id)
+            )
+
+        return state, r
     
 
-    def dislike(self, game_id:int, user_id:int) -> "int | None":
+    def dislike(
+        self, game_id:int, user_id:int
+    ) -> "Tuple[int | None, Reaction | None]":
         '''
-        Returns None if no game found.
+        Returns the state and the game's reaction manager.
+        The state is None if no game found.
 
         0 if disliked successfully.
         1 if already liked.
@@ -487,25 +1213,26 @@ class Manager:
         '''
         self.check_user(user_id)
 
-        if game_id not in self.reactions:
-            return None
-        
-        r = self.reactions[game_id]
+        r: "Reaction | None" = self.reactions.get(game_id)
+        if r == None:
+            return None, None
 
         # checking if liked own explanation
         if r.explainer_id == user_id:
-            return 3
+            return 3, r
         
         state = r.get_user(user_id)
 
         # disliking
         if state == 0:
-            r.dislikes.append(user_id)
             self.users[r.explainer_id].dislikes += 1
+            self.mark_user(r.explainer_id)
             self.commit()
-            log(f'{user_id} disliked {game_id}', 'api')
 
-        return state 
+            r.dislikes[user_id] = None
+            log('%s disliked %s', 'api', args=(user_id, game_id))
+
+        return state, r
 
 
     def get_restriction(
@@ -514,16 +1241,13 @@ class Manager:
         '''
         Returns the channel restriction.
 
-        If there is none, returns None.
-        
-        If the restriction expired, removes the channel restriction.
+        If there is none or it expired, returns None.
+        Expired restrictions are removed by `expire`.
         '''
         if channel_id not in self.restrictions:
             return None
         
         if self.restrictions[channel_id].until <= time.time():
-            # removing expired restriction
-            self.restrictions.pop(channel_id)
             return None
         
         return self.restrictions[channel_id]
@@ -533,13 +1257,13 @@ class Manager:
         '''
         Returns the game if it exists in the current channel.
         Otherwise returns None.
+
+        Expired games are removed by `expire`.
         '''
         if channel_id not in self.games:
             return None
         
         if self.games[channel_id].until <= time.time():
-            # removing expired game
-            self.games.pop(channel_id)
             return None
         
         return self.games[channel_id]
@@ -566,8 +1290,13 @@ class Manager:
         self.games[channel_id] = Game(
             channel_id, message_id, starter_id, word, starter_name
         )
+        self.deadlines.add(('game', channel_id), self.games[channel_id].until)
 
-        log(f'{starter_id} started new game in {channel_id} with word {word}', 'api')
+        log(
+            '%s started new game in %s with word %s', 'api',
+            args=(starter_id, channel_id, word)
+        )
+        self.mark_user(starter_id)
         self.commit()
         return word, events
     
@@ -579,8 +1308,29 @@ class Manager:
         Stops the ongoing game.
         '''
         if channel_id in self.games:
-            log(f'Game in {channel_id} stopped', 'api')
+            log('Game in %s stopped', 'api', args=(channel_id,))
             self.games.pop(channel_id)
+            self.deadlines.cancel(('game', channel_id))
+
+
+    def expire(self) -> List[Game]:
+        '''
+        Removes games and restrictions that ran out of time.
+        Returns the removed games.
+        '''
+        games: List[Game] = []
+
+        for kind, channel_id in self.deadlines.pop_expired(time.time()):
+            if kind == 'restriction':
+                self.restrictions.pop(channel_id, None)
+                continue
+
+            game: "Game | None" = self.games.pop(channel_id, None)
+            if game != None:
+                log('Game in %s expired', 'api', args=(channel_id,))
+                games.append(game)
+
+        return games
 
 
     def new_word(
@@ -602,6 +1352,7 @@ class Manager:
         word: str = self.get_word(guild_id)
         self.games[channel_id].change_word(word)
 
+        self.mark_user(user_id)
         self.commit()
         return word, events
     
@@ -637,27 +1388,40 @@ class Manager:
         explainer_events.extend(self.check_user(explainer_id))
         self.check_guild(guild_id)
 
+        # the game is only finished once the stats are written
+        with self.batch_users():
+            guesser: User = self.users[guesser_id]
+            explainer: User = self.users[explainer_id]
+
+            # add moonrocks
+            self.change_stat(explainer, 'moonrocks', game.moonrocks)
+
+            # add stat
+            self.change_stat(guesser, 'xp', len(game.word))
+            guesser.xp_guessed += len(game.word)
+            self.change_stat(guesser, 'words_guessed', 1)
+
+            self.change_stat(explainer, 'xp', len(game.word))
+            explainer.xp_explained += len(game.word)
+            explainer.words_explained += 1
+
         # finish game
         self.games.pop(channel_id)
+        self.deadlines.cancel(('game', channel_id))
+
         self.restrictions[channel_id] = Restriction(
             channel_id, guesser_id, time.time()+RESTRICTION_TIME
         )
-
-        # add moonrocks
-        self.users[explainer_id].moonrocks += game.moonrocks
-
-        # add stat
-        self.users[guesser_id].xp += len(game.word)
-        self.users[guesser_id].xp_guessed += len(game.word)
-        self.users[guesser_id].words_guessed += 1
-
-        self.users[explainer_id].xp += len(game.word)
-        self.users[explainer_id].xp_explained += len(game.word)
-        self.users[explainer_id].words_explained += 1
+        self.deadlines.add(('restriction', channel_id), self.restrictions[channel_id].until)
 
         self.guilds[guild_id].word_guessed(guesser_id)
         guesser_events.extend(self.check_user(guesser_id))
 
+        self.mark_user(guesser_id, explainer_id)
+        self.mark_guild(guild_id)
         self.commit()
-        log(f'{guesser_id} guessed the word {game.word} and got {len(game.word)} XP', 'api')
+        log(
+            '%s guessed the word %s and got %s XP', 'api',
+            args=(guesser_id, game.word, len(game.word))
+        )
         return game, guesser_events, explainer_events
@@ -0,0 +1,47 @@
+import os
+import sys
+import queue
+import timeit
+import datetime
+from typing import *
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import log
+
+
+# usage: python bench/log_calls.py
+# measures the cost of a log call in the calling thread,
+# the background writer is stopped so nothing gets printed
+
+log.writer.stop()
+log.writer.queue = queue.SimpleQueue()
+
+CALLS: int = 200_000
+amount: int = 7
+id: int = 698457845301248010
+
+
+def eager_old():
+    '''
+    The log call before levels and the timestamp cache.
+    '''
+    ct = datetime.datetime.now()
+    time = f'{ct.year}-{ct.month:0>2}-{ct.day:0>2} {ct.hour:0>2}:{ct.minute:0>2}:{ct.second:0>2}'
+    string = f'{log.INFO.color}[{log.INFO.name}]{log.colorama.Fore.RESET} [{time}] [api] Added {amount} XP to {id}'
+    file_string = f'[{log.INFO.name}] [{time}] [api] Added {amount} XP to {id}\n'
+    log.writer.queue.put((string, file_string))
+
+
+cases: Dict[str, Callable[[], None]] = {
+    'old eager formatting':  eager_old,
+    'enabled, f-string':     lambda: log.log(f'Added {amount} XP to {id}', 'api'),
+    'enabled, deferred':     lambda: log.log('Added %s XP to %s', 'api', args=(amount, id)),
+    'disabled, f-string':    lambda: log.log(f'Added {amount} XP to {id}', 'api'),
+    'disabled, deferred':    lambda: log.log('Added %s XP to %s', 'api', args=(amount, id)),
+}
+
+for name, function in cases.items():
+    log.set_level('api', log.WARNING if name.startswith('disabled') else log.INFO)
+
+    seconds: float = min(timeit.repeat(function, number=CALLS, repeat=3))
+    print(f'{name:<24} {seconds/CALLS*1e9:>8.0f} ns/call')
@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import tracemalloc
+from typing import *
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import api
+
+
+# usage: python bench/user_memory.py
+# loads synthetic users the way load_users does
+# and measures the memory they take up
+
+USERS: int = 1_000_000
+
+
+class OldUser:
+    def __init__(self, id:str, data:dict):
+        '''
+        The user before slots, keeping the parsed dict.
+        '''
+        self.id: int = int(id)
+        self.data: dict = data
+
+        self.started_playing: int = data.get('started_playing',time.time())
+
+        self.xp: int = data.get('xp', 0)
+        self.xp_guessed: int = data.get('xp_guessed', 0)
+        self.xp_explained: int = data.get('xp_explained', 0)
+        self.moonrocks: int = data.get('moonrocks',0)
+
+        self.words_guessed: int = data.get('words_guessed',0)
+        self.words_explained: int = data.get('words_explained',0)
+        self.words_chosen: int = data.get('words_chosen',0)
+
+        self.likes: int = data.get('likes', 0)
+        self.dislikes: int = data.get('dislikes', 0)
+
+
+def make_data(i:int) -> dict:
+    '''
+    Returns a synthetic user like the ones in the database.
+    '''
+    return {
+        "xp": i*7 % 50000,
+        "xp_guessed": i*3 % 30000,
+        "xp_explained": i*4 % 20000,
+        "moonrocks": i % 1000,
+        "words_guessed": i % 3000,
+        "words_explained": i % 2000,
+        "words_chosen": i % 5000,
+        "started_playing": 1.7e9+i,
+        "likes": i % 300,
+        "dislikes": i % 100,
+    }
+
+
+def measure(name:str, kind:type):
+    '''
+    Prints the memory taken by the users and the load time.
+    '''
+    tracemalloc.start()
+    start: float = time.perf_counter()
+
+    users: dict = {
+        698457845301248010+i: kind(698457845301248010+i, make_data(i))
+        for i in range(USERS)
+    }
+
+    seconds: float = time.perf_counter()-start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f'{name:<16} {size/USERS:>8.0f} bytes/user {size/1024**2:>10.1f} MB {seconds:>8.2f} s')
+    del users
+
+
+measure('dict + __dict__', OldUser)
+measure('__slots__', api.User)
@@ -0,0 +1,141 @@
+import os
+import sys
+import heapq
+import timeit
+import tempfile
+import tracemalloc
+from typing import *
+
+ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import api
+import storage
+import usertable
+
+
+# usage: python bench/user_table.py
+# compares a dict of users with the columnar table:
+# memory of a manager with 1M synthetic users, global leaderboards included,
+# and the latency of aggregates
+
+USERS: int = 1_000_000
+EDGES: List[int] = [0, 10, 100, 1000, 10000, 100000]
+FIRST_ID: int = 698457845301248010
+
+
+class MemoryStorage(storage.Storage):
+    def __init__(self, raw:dict):
+        '''
+        Hands the passed data to the manager once.
+        '''
+        self.raw: "dict | None" = raw
+
+
+    def load(self) -> "dict | None":
+        raw, self.raw = self.raw, None
+        return raw
+
+
+    # nothing is kept
+    def write(self, records:List[dict]):
+        pass
+
+
+    def compact(self, data:dict):
+        pass
+
+
+    def backup(self):
+        pass
+
+
+def make_data(i:int) -> dict:
+    '''
+    Returns a synthetic user like the ones in the database.
+    '''
+    return {
+        "xp": i*7 % 50000,
+        "xp_guessed": i*3 % 30000,
+        "xp_explained": i*4 % 20000,
+        "moonrocks": i % 1000,
+        "words_guessed": i % 3000,
+        "words_explained": i % 2000,
+        "words_chosen": i % 5000,
+        "started_playing": 1.7e9+i,
+        "likes": i % 300,
+        "dislikes": i % 100,
+    }
+
+
+def load(kind:str, scan:bool=False) -> api.Manager:
+    '''
+    Loads the synthetic users into a manager and prints its memory.
+    '''
+    tracemalloc.start()
+
+    raw: dict = {
+        "users": {FIRST_ID+i: make_data(i) for i in range(USERS)},
+        "guilds": {}
+    }
+
+    api.USER_STORE = kind
+    api.SCAN_GLOBAL_RANKS = scan
+    mg = api.Manager(
+        os.path.join(ROOT, 'data.json'), MemoryStorage(raw),
+        os.path.join(tempfile.gettempdir(), 'bench-state.json')
+    )
+    del raw
+
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    name: str = f'{kind}, scanned ranks' if scan else kind
+    print(f'{name}: {size/USERS:.0f} bytes/user, {size/1024**2:.1f} MB')
+    return mg
+
+
+def best_of(function:Callable[[], Any]) -> float:
+    '''
+    Returns the fastest run time of the function in milliseconds.
+    '''
+    return min(timeit.repeat(function, number=1, repeat=5))*1000
+
+
+def dict_histogram(users:Dict[int, api.User]) -> List[int]:
+    counts: List[int] = [0]*(len(EDGES)-1)
+
+    for user in users.values():
+        for i in range(len(EDGES)-1):
+            if EDGES[i] <= user.xp < EDGES[i+1]:
+                counts[i] += 1
+                break
+
+    return counts
+
+
+def print_global(mg:api.Manager):
+    print(f'  global top   {best_of(lambda: mg.get_global_leaderboard("xp", 10)):>10.2f} ms')
+    print(f'  global rank  {best_of(lambda: mg.get_global_rank(FIRST_ID+USERS//2, "xp")):>10.2f} ms')
+    print(f'  add xp       {best_of(lambda: mg.change_stat(mg.users[FIRST_ID+USERS//2], "xp", 5)):>10.2f} ms')
+
+
+print(f'numpy: {"yes" if usertable.numpy != None else "no"}')
+
+mg = load('objects')
+users = mg.users
+print(f'  total        {best_of(lambda: sum([i.xp for i in users.values()])):>10.2f} ms')
+print(f'  top 10       {best_of(lambda: heapq.nlargest(10, users.values(), key=lambda i: i.xp)):>10.2f} ms')
+print(f'  histogram    {best_of(lambda: dict_histogram(users)):>10.2f} ms')
+print_global(mg)
+del mg, users
+
+mg = load('columns')
+table = mg.users
+print(f'  total        {best_of(lambda: table.get_total("xp")):>10.2f} ms')
+print(f'  top 10       {best_of(lambda: table.get_top("xp", 10)):>10.2f} ms')
+print(f'  histogram    {best_of(lambda: table.get_histogram("xp", EDGES)):>10.2f} ms')
+print_global(mg)
+del mg, table
+
+mg = load('columns', scan=True)
+print_global(mg)
@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+from typing import *
+
+ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import api
+import storage
+
+
+# usage: python bench/warm_restart.py
+# saves and restores the state of 10k channels with a running game,
+# a restriction and a reaction each
+
+CHANNELS: int = 10_000
+
+folder: str = tempfile.mkdtemp()
+state_path: str = os.path.join(folder, 'state.json')
+
+
+def new_manager() -> api.Manager:
+    return api.Manager(
+        os.path.join(ROOT, 'data.json'),
+        storage.JSONStorage(os.path.join(folder, 'users.json')),
+        state_path
+    )
+
+
+# made before the state is saved so it starts empty
+mg = new_manager()
+restored = new_manager()
+now: float = time.time()
+
+for i in range(CHANNELS):
+    channel_id: int = 1100000000000000000+i
+    message_id: int = 1200000000000000000+i
+    mg.games[channel_id] = api.Game(
+        channel_id, message_id, 698457845301248010+i, 'крокодил', f'user{i}'
+    )
+    mg.deadlines.add(('game', channel_id), mg.games[channel_id].until)
+
+    mg.restrictions[channel_id+CHANNELS] = api.Restriction(
+        channel_id+CHANNELS, 698457845301248010+i, now+60
+    )
+    mg.deadlines.add(('restriction', channel_id+CHANNELS), now+60)
+
+    reaction = api.Reaction(message_id, 698457845301248010+i)
+    reaction.likes = dict.fromkeys(range(698457845301248010, 698457845301248015))
+    mg.reactions[message_id] = reaction
+
+start: float = time.perf_counter()
+mg.save_state()
+save_time: float = time.perf_counter()-start
+
+start = time.perf_counter()
+restored.load_state()
+load_time: float = time.perf_counter()-start
+
+assert len(restored.games) == CHANNELS and len(restored.reactions) == CHANNELS
+
+print(f'state file    {os.path.getsize(state_path)/1024:>10.0f} KB')
+print(f'save          {save_time*1000:>10.2f} ms')
+print(f'restore       {load_time*1000:>10.2f} ms')
+
+shutil.rmtree(folder)
@@ -0,0 +1,37 @@
+import random
+import timeit
+import tracemalloc
+from typing import *
+
+
+# usage: python bench/word_choice.py
+
+def make_words(amount:int) -> List[str]:
+    '''
+    Returns a list of unique fake words.
+    '''
+    return [f'слово{i}' for i in range(amount)]
+
+
+def measure(name:str, choose:Callable[[], str], calls:int):
+    '''
+    Prints per-call latency and memory allocated by one call.
+    '''
+    seconds: float = min(timeit.repeat(choose, number=calls, repeat=3))
+
+    tracemalloc.start()
+    choose()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f'  {name:<8} {seconds/calls*1e6:>12.2f} us/call {peak:>14,} bytes peak')
+
+
+for amount in [16_000, 1_000_000]:
+    words: List[str] = make_words(amount)
+    word_set: Set[str] = set(words)
+    calls: int = 200 if amount > 100_000 else 5000
+
+    print(f'{amount:,} words')
+    measure('before', lambda: random.choice(list(word_set)), calls)
+    measure('after', lambda: random.choice(words), calls)
@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+from typing import *
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import words
+
+
+# usage: python bench/word_index.py
+
+def parse_sets(path:str):
+    '''
+    Parses the word list the way languages were loaded before the index.
+    '''
+    with open(path, encoding='utf-8') as f:
+        raw: str = f.read()
+
+    all_words: Set[str] = {i.lower().replace('ё','е') for i in raw.split('\n') if i != ''}
+    filtered: Set[str] = {i for i in all_words if i.isalpha()}
+
+
+def best_of(function:Callable[[], Any], repeat:int=5) -> float:
+    '''
+    Returns the fastest run time of the function in milliseconds.
+    '''
+    times: List[float] = []
+
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        function()
+        times.append(time.perf_counter()-start)
+
+    return min(times)*1000
+
+
+def rebuild(path:str):
+    '''
+    Loads the word list with no usable cache.
+    '''
+    if os.path.exists(words.index_path(path)):
+        os.remove(words.index_path(path))
+    words.open_index(path)
+
+
+folder: str = tempfile.mkdtemp()
+
+# real word list and a big synthetic one
+lists: Dict[str, str] = {'ru-ru.txt': os.path.join(folder, 'ru-ru.txt')}
+shutil.copyfile(os.path.join(os.path.dirname(__file__), '..', 'lang', 'ru-ru.txt'), lists['ru-ru.txt'])
+
+lists['1M synthetic'] = os.path.join(folder, 'big.txt')
+with open(lists['1M synthetic'], 'w', encoding='utf-8') as f:
+    f.write('\n'.join([f'слово{i}' for i in range(1_000_000)]))
+
+for name, path in lists.items():
+    print(name)
+    print(f'  parsing into sets   {best_of(lambda: parse_sets(path), 3):>10.2f} ms')
+    print(f'  index, no cache     {best_of(lambda: rebuild(path), 3):>10.2f} ms')
+    print(f'  index, cached       {best_of(lambda: words.open_index(path)):>10.2f} ms')
+
+shutil.rmtree(folder)
@@ -0,0 +1,200 @@
+import os
+import sys
+import json
+import time
+import signal
+import subprocess
+from typing import *
+from log import *
+from config import *
+import storage
+import words
+import api
+
+
+# workers
+
+def get_shard_ranges(processes:int, shards:int) -> List[List[int]]:
+    '''
+    Splits the shards into even ranges, one for each process.
+    '''
+    return [
+        list(range(i*shards//processes, (i+1)*shards//processes))
+        for i in range(processes)
+    ]
+
+
+def get_worker_path(path:str, id:int) -> str:
+    '''
+    Returns the path of the worker's own copy of a file.
+    '''
+    base, extension = os.path.splitext(path)
+    return f'{base}-{id}{extension}'
+
+
+class Worker:
+    def __init__(self, id:int, shard_ids:List[int], shard_count:int):
+        '''
+        A bot process running the specified shards.
+        '''
+        self.id: int = id
+        self.shard_ids: List[int] = shard_ids
+        self.shard_count: int = shard_count
+
+        self.process: "subprocess.Popen | None" = None
+        self.started: float = 0
+
+
+    def start(self):
+        '''
+        Starts the bot process.
+        '''
+        self.process = subprocess.Popen(
+            [sys.executable, 'main.py'],
+            env={
+                **os.environ,
+                "SHARD_IDS": ','.join([str(i) for i in self.shard_ids]),
+                "SHARD_COUNT": str(self.shard_count),
+                "LOG_FILE": get_worker_path(LOG_FILE, self.id),
+                "STATE_FILE": get_worker_path(STATE_FILE, self.id),
+            }
+        )
+        self.started = time.time()
+
+        log(
+            f'Started worker {self.id} with shards {self.shard_ids}, '\
+            f'pid {self.process.pid}', 'cluster'
+        )
+
+
+    def wait(self, timeout:float) -> bool:
+        '''
+        Waits for the bot process to exit.
+        Returns False if it's still running after the timeout.
+        '''
+        if self.process == None:
+            return True
+
+        try:
+            self.process.wait(max(timeout, 0))
+        except subprocess.TimeoutExpired:
+            return False
+
+        return True
+
+
+    def stop(self):
+        '''
+        Asks the bot to shut down and waits for it,
+        killing it if it takes too long.
+        '''
+        if self.process == None or self.process.poll() != None:
+            return
+
+        self.process.terminate()
+
+        if not self.wait(WORKER_STOP_TIMEOUT):
+            log(f'Worker {self.id} did not stop, killing', 'cluster', level=WARNING)
+            self.process.kill()
+            self.process.wait()
+
+
+# cluster
+
+def prepare_database():
+    '''
+    Creates the shared database before the workers start,
+    importing the JSON database if there is one.
+    '''
+    if not os.path.exists(SQLITE_FILE) and os.path.exists(USERS_FILE):
+        storage.migrate(USERS_FILE, SQLITE_FILE)
+
+    storage.SharedUsers(SQLITE_FILE, api.RANKED_STATS).close()
+
+
+def prepare_languages():
+    '''
+    Builds missing and outdated word indexes
+    before the workers start, so they don't all build them.
+    '''
+    with open(DATA_FILE, encoding='utf-8') as f:
+        data: dict = json.load(f)
+
+    for key, language in data['languages'].items():
+        try:
+            words.open_index(LANG_FOLDER+language['file'])
+        except Exception as e:
+            log(f'Failed building word index of {key}: {e}', 'cluster', level=ERROR)
+            continue
+
+        log(f'Word index of {key} is ready', 'cluster')
+
+
+def run(processes:int, shards:int):
+    '''
+    Runs the workers until interrupted,
+    restarting the ones that crash.
+    '''
+    if processes < 1 or shards < processes:
+        raise ValueError('Need at least one process and one shard per process')
+
+    prepare_database()
+    prepare_languages()
+
+    workers: List[Worker] = [
+        Worker(id, shard_ids, shards)
+        for id, shard_ids in enumerate(get_shard_ranges(processes, shards))
+    ]
+    log(f'Starting {processes} workers with {shards} shards', 'cluster', level=SUCCESS)
+
+    # stopping the workers on SIGTERM too instead of leaving them running
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    interrupted: bool = False
+
+    try:
+        for worker in workers:
+            worker.start()
+
+        while True:
+            time.sleep(1)
+
+            for worker in workers:
+                if worker.process.poll() == None\
+                    or worker.started+WORKER_RESTART_DELAY > time.time():
+                        continue
+
+                log(
+                    f'Worker {worker.id} exited with code '\
+                    f'{worker.process.returncode}, restarting', 'cluster', level=ERROR
+                )
+                worker.start()
+
+    except KeyboardInterrupt:
+        # ctrl+c reaches the whole process group,
+        # so the workers are already shutting down
+        interrupted = True
+
+    finally:
+        log('Stopping workers...', 'cluster')
+
+        if interrupted:
+            deadline: float = time.time()+WORKER_STOP_TIMEOUT
+            for worker in workers:
+                worker.wait(deadline-time.time())
+
+        # letting all workers shut down at the same time
+        for worker in workers:
+            if worker.process != None and worker.process.poll() == None:
+                worker.process.terminate()
+
+        for worker in workers:
+            worker.stop()
+        log('Cluster stopped', 'cluster', level=SUCCESS)
+
+
+# usage: python cluster.py [processes] [shards]
+if __name__ == '__main__':
+    run(
+        int(sys.argv[1]) if len(sys.argv) > 1 else CLUSTER_PROCESSES,
+        int(sys.argv[2]) if len(sys.argv) > 2 else CLUSTER_SHARDS
+    )
@@ -9,9 +9,57 @@ LANG_FOLDER: str = 'lang/'
 LOG_FILE: str = 'log.txt'
 DATA_FILE: str = 'data.json'
 USERS_FILE: str = 'users.json'
+SQLITE_FILE: str = 'users.db'
+STATE_FILE: str = 'state.json' # running games, restrictions and reactions
+                               # saved to continue them after a restart
+
+STORAGE: str = 'json' # where user data is stored, 'json' or 'sqlite'.
+                      # use `python storage.py` to move a JSON database to SQLite
+USER_STORE: str = 'objects' # how users are kept in memory, 'objects' or 'columns'.
+                            # columns take less memory with a lot of users
+SCAN_GLOBAL_RANKS: bool = False # with 'columns', counts global leaderboards from
+                                # the columns instead of keeping them sorted.
+                                # saves memory, but every rank looks at every user
+
+CLUSTER_PROCESSES: int = 2 # worker processes started by `python cluster.py`
+CLUSTER_SHARDS: int = 2 # shards split between the workers,
+                        # discord needs at least one per 2500 guilds
+WORKER_RESTART_DELAY: int = 10 # min time in seconds between
+                               # restarts of a crashed worker
+WORKER_STOP_TIMEOUT: int = 30 # time in seconds a stopping worker gets
+                              # to write its data before it's killed
+SHARED_USERS_TIMEOUT: float = 1 # max time in seconds a worker waits for another
+                                # one writing users, the bot is blocked meanwhile
 
 FILTER_SYMBOLS_BY_DEFAULT: bool = False
 RESTRICTION_TIME: int = 10 # time in seconds between guessing the word
                            # and any user being able to start the game
 GAME_LENGTH: int = 60*5 # time given in seconds to explain the word
                         # before the game stops
+ENDING_MESSAGE_CONCURRENCY: int = 5 # max amount of "nobody guessed the word"
+                                    # messages being sent at the same time
+REACTION_LIMIT: int = 10000 # max amount of finished games that can
+                            # be liked or disliked at the same time
+
+COMMIT_INTERVAL: int = 30 # time in seconds between writing
+                          # modified users and guilds to disk
+COMMIT_BATCH_SIZE: int = 100 # amount of unwritten changes that
+                             # forces the data to be written early
+JOURNAL_COMPACT_SIZE: int = 10000 # amount of journal records after which
+                                  # they get compacted into the database
+STATE_INTERVAL: int = 15 # time in seconds between saving
+                         # running games to the state file
+
+LANGUAGE_IDLE_TIME: int = 60*30 # time in seconds after which an unused
+                                # language gets unloaded from memory
+LANGUAGE_MEMORY_BUDGET: int = 64*1024*1024 # max amount of memory in bytes loaded
+                                           # languages can take up together
+
+LOG_MAX_SIZE: int = 10*1024*1024 # size of the log file in bytes
+                                 # after which it gets archived
+LOG_ROTATE_DAILY: bool = True # whether to archive the log file every day
+LOG_ARCHIVES: int = 30 # amount of archived log files to keep, 0 to keep all
+LOG_LEVELS: Dict[str, str] = { # minimum level of logged messages from each origin,
+    "bot": "INFO",             # one of INFO, SUCCESS, WARNING or ERROR
+    "api": "INFO",
+}
@@ -1,35 +1,224 @@
 import colorama
 import datetime
 import config
+import time
+import os
+import glob
+import gzip
+import queue
+import shutil
+import atexit
+import threading
+from typing import *
 colorama.init()
 
+# names other modules get from `from log import *`
+__all__ = [
+    'Level', 'INFO', 'SUCCESS', 'WARNING', 'ERROR', 'LEVELS',
+    'set_level', 'log',
+]
+
 # levels
 class Level:
-    def __init__(self, name, color):
+    def __init__(self, name, color, value):
         self.name = name
         self.color = color
+        self.value = value
+
+INFO =    Level("INFO   ", colorama.Fore.LIGHTBLUE_EX, 10)
+SUCCESS = Level("SUCCESS", colorama.Fore.LIGHTGREEN_EX, 20)
+WARNING = Level("WARNING", colorama.Fore.LIGHTYELLOW_EX, 30)
+ERROR =   Level("ERROR  ", colorama.Fore.LIGHTRED_EX, 40)
+
+LEVELS: Dict[str, Level] = {
+    i.name.strip(): i for i in [INFO, SUCCESS, WARNING, ERROR]
+}
+
+# minimum level value logged for each origin
+min_levels: Dict[str, int] = {}
+
+def set_level(origin:str, level:"Level | str"):
+    '''
+    Sets the minimum level of messages logged from the origin.
+    '''
+    if isinstance(level, str):
+        level = LEVELS[level.upper()]
+    min_levels[origin] = level.value
+
+for origin, level in config.LOG_LEVELS.items():
+    set_level(origin, level)
+
+
+# timestamp
+last_second: int = -1
+last_timestamp: str = ''
+
+def get_timestamp() -> str:
+    '''
+    Returns the current time as a string.
+    Only formats it once a second.
+    '''
+    global last_second, last_timestamp
+
+    now: float = time.time()
+    if int(now) != last_second:
+        last_second = int(now)
+        last_timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now))
+
+    return last_timestamp
+
+
+# writer
+class LogWriter(threading.Thread):
+    def __init__(self, path:str):
+        '''
+        Writes queued log lines to the console and the file
+        in a background thread.
+        '''
+        super().__init__(name='log writer', daemon=True)
+        self.path: str = path
+        self.queue: "queue.Queue[Tuple[str, str | None] | None]" = queue.Queue()
+
+        self.file: "TextIO | None" = None
+        self.file_date: "datetime.date | None" = None
+
+
+    def run(self):
+        running: bool = True
+
+        while running:
+            # waiting for a line and taking everything else queued
+            batch: list = [self.queue.get()]
+            while len(batch) < 1000:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if None in batch:
+                running = False
+                batch = batch[:batch.index(None)]
+
+            try:
+                self.write(batch)
+            except Exception as e:
+                print(f'Failed writing log: {e}')
+
+        if self.file != None:
+            self.file.close()
+
+
+    def write(self, batch:List[Tuple[str, "str | None"]]):
+        '''
+        Writes a batch of lines.
+        '''
+        print('\n'.join([i[0] for i in batch]))
+
+        lines: List[str] = [i[1] for i in batch if i[1] != None]
+        if not lines:
+            return
+
+        self.rotate()
+        self.file.write(''.join(lines))
+        self.file.flush()
+
+
+    def rotate(self):
+        '''
+        Opens the log file, archiving the current one if it's
+        too big or was started on another day.
+        '''
+        today: datetime.date = datetime.date.today()
+
+        if self.file != None:
+            if self.file.tell() < config.LOG_MAX_SIZE\
+                and (not config.LOG_ROTATE_DAILY or self.file_date == today):
+                    return
+
+            self.file.close()
+            self.file = None
+            self.archive()
+
+        # continuing the existing file
+        if os.path.exists(self.path):
+            modified = datetime.date.fromtimestamp(os.path.getmtime(self.path))
+
+            if os.path.getsize(self.path) >= config.LOG_MAX_SIZE\
+                or (config.LOG_ROTATE_DAILY and modified != today):
+                    self.archive()
+
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self.file_date = today
+
+
+    def archive(self):
+        '''
+        Compresses the log file into a dated archive
+        and removes the oldest archives.
+        '''
+        if not os.path.exists(self.path):
+            return
+
+        name: str = datetime.datetime.now().strftime('%Y-%m-%d-%H%M%S')
+        base, extension = os.path.splitext(self.path)
+        archive_path: str = f'{base}-{name}{extension}.gz'
+
+        number: int = 1
+        while os.path.exists(archive_path):
+            archive_path = f'{base}-{name}-{number}{extension}.gz'
+            number += 1
+
+        with open(self.path, 'rb') as source, gzip.open(archive_path, 'wb') as target:
+            shutil.copyfileobj(source, target)
+        os.remove(self.path)
+
+        # removing old archives
+        archives: List[str] = sorted(glob.glob(f'{glob.escape(base)}-*{extension}.gz'))
+        for i in archives[:-config.LOG_ARCHIVES] if config.LOG_ARCHIVES > 0 else []:
+            os.remove(i)
+
+
+    def stop(self):
+        '''
+        Writes everything queued and stops the thread.
+        '''
+        if not self.is_alive():
+            return
+
+        self.queue.put(None)
+        self.join()
+
+
+# cluster workers each get their own file
+writer = LogWriter(os.getenv('LOG_FILE', config.LOG_FILE))
+writer.start()
+atexit.register(writer.stop)
 
-INFO =    Level("INFO   ", colorama.Fore.LIGHTBLUE_EX)
-SUCCESS = Level("SUCCESS", colorama.Fore.LIGHTGREEN_EX)
-WARNING = Level("WARNING", colorama.Fore.LIGHTYELLOW_EX)
-ERROR =   Level("ERROR  ", colorama.Fore.LIGHTRED_EX)
 
 # log
-def log(text:str, origin:str='bot', level:Level=INFO, to_file:bool=True):
+def log(
+    text:str, origin:str='bot', level:Level=INFO,
+    to_file:bool=True, args:tuple=()
+):
     '''
     Logs a message in the console and/or the file.
+
+    If `args` are passed, the text is formatted with them
+    using `%` only if the message is going to be logged.
+
+    The message is written by a background thread.
     '''
-    ct = datetime.datetime.now()
-    time = f'{ct.year}-{ct.month:0>2}-{ct.day:0>2} {ct.hour:0>2}:{ct.minute:0>2}:{ct.second:0>2}'
+    if level.value < min_levels.get(origin, 0):
+        return
+
+    if args:
+        text = text % args
+    timestamp: str = get_timestamp()
 
     # logging to console
-    string = f'{level.color}[{level.name}]{colorama.Fore.RESET} [{time}] [{origin}] {text}'
-    print(string)
+    string = f'{level.color}[{level.name}]{colorama.Fore.RESET} [{timestamp}] [{origin}] {text}'
 
     # logging to file
-    if not to_file:
-        return
-    
-    with open(config.LOG_FILE, 'a', encoding='utf-8') as file:
-        string = f'[{level.name}] [{time}] [{origin}] {text}\n'
-        file.write(string)
\ No newline at end of file
+    file_string = f'[{level.name}] [{timestamp}] [{origin}] {text}\n' if to_file else None
+
+    writer.queue.put((string, file_string))
@@ -1,9 +1,13 @@
 import asyncio
+import signal
+import sqlite3
 import time
 from config import *
+import config
 import api
 from log import *
 import utils
+import storage
 
 from typing import *
 import discord
@@ -18,65 +22,105 @@ from typing import *
 load_dotenv()
 TOKEN = os.getenv('BOT_TOKEN')
 
+# set by cluster.py when running as one of its workers
+SHARD_IDS: "List[int] | None" = [int(i) for i in os.getenv('SHARD_IDS').split(',')]\
+    if os.getenv('SHARD_IDS') else None
+SHARD_COUNT: "int | None" = int(os.getenv('SHARD_COUNT')) if SHARD_IDS != None else None
+
 intents = discord.Intents.default()
 intents.message_content = True
-bot = commands.Bot(
-    command_prefix=PREFIX,
-    help_command=None,
-    intents=intents
-)
-mg = api.Manager(DATA_FILE, USERS_FILE)
+
+if SHARD_IDS == None:
+    bot = commands.Bot(
+        command_prefix=PREFIX,
+        help_command=None,
+        intents=intents
+    )
+    mg = api.Manager(DATA_FILE, storage.get_storage(STORAGE), STATE_FILE)
+
+# only guilds of the worker's shards are loaded,
+# users are shared between all workers
+else:
+    bot = commands.AutoShardedBot(
+        command_prefix=PREFIX,
+        help_command=None,
+        intents=intents,
+        shard_ids=SHARD_IDS,
+        shard_count=SHARD_COUNT
+    )
+    mg = api.Manager(
+        DATA_FILE,
+        storage.SQLiteStorage(SQLITE_FILE, SHARD_IDS, SHARD_COUNT),
+        os.getenv('STATE_FILE', STATE_FILE),
+        storage.SharedUsers(SQLITE_FILE, api.RANKED_STATS)
+    )
 
 
 
 # tasks
 
-@tasks.loop(seconds=2)
+# limits ending messages being sent at the same time
+ending_semaphore = asyncio.Semaphore(ENDING_MESSAGE_CONCURRENCY)
+ending_tasks: Set[asyncio.Task] = set()
+
+
+async def send_ending_message(game:api.Game):
+    # sending message
+    try:
+        # creating embed
+        embed = discord.Embed(
+            description='🚫 Никто так и не угадал!'\
+                f'\n\nСлово было - **{game.word}**',
+            color=discord.Color.red()
+        )
+        embed.set_footer(
+            text=f'Если что, было {round(config.GAME_LENGTH/60)} минут на ответ.'
+        )
+
+        # sending
+        async with ending_semaphore:
+            # only asking discord if the channel is not cached
+            channel = bot.get_channel(game.channel_id)\
+                or await bot.fetch_channel(game.channel_id)
+            await channel.send(embed=embed, view=views['play_again'])
+
+    except Exception as e:
+        log(
+            'Unable to send ending message to '\
+            f'{game.channel_id}: {e}', level=ERROR
+        )
+    else:
+        log(f'Sent ending message to {game.channel_id}')
+
+
+@tasks.loop()
 async def check():
-    # checking games
-    games: List[api.Game] = list(mg.games.values())
-    for game in games:
-        # game expired
-        if game.until <= time.time():
-            # sending message
-            try:
-                # creating embed
-                embed = discord.Embed(
-                    description='🚫 Никто так и не угадал!'\
-                        f'\n\nСлово было - **{game.word}**',
-                    color=discord.Color.red()
-                )
-                embed.set_footer(
-                    text=f'Если что, было {round(config.GAME_LENGTH/60)} минут на ответ.'
-                )
-    
-                # creating view
-                view = discord.ui.View(
-                    timeout=config.GAME_LENGTH
-                )
-
-                new_game_btn = discord.ui.Button(
-                    style=discord.ButtonStyle.blurple,
-                    label='Играть ещё',
-                    emoji='🎮'
-                )
-                new_game_btn.callback = new_game
-                view.add_item(new_game_btn)
-
-                # sending
-                channel = await bot.fetch_channel(game.channel_id)
-                await channel.send(embed=embed, view=view)
-
-            except Exception as e:
-                log(
-                    'Unable to send ending message to '\
-                    f'{game.channel_id}: {e}', level=ERROR
-                )
-            else:
-                log(f'Sent ending message to {game.channel_id}')
-
-            # removing game
-            mg.games.pop(game.channel_id)
+    # waiting for the next game or restriction to expire
+    await mg.deadlines.wait()
+
+    # sending ending messages without waiting for each other
+    for game in mg.expire():
+        task = asyncio.create_task(send_ending_message(game))
+        ending_tasks.add(task)
+        task.add_done_callback(ending_tasks.discard)
+
+
+@tasks.loop(seconds=COMMIT_INTERVAL)
+async def flush():
+    # writing modified users and guilds
+    await mg.flush_async()
+
+
+@tasks.loop(seconds=STATE_INTERVAL)
+async def save_state():
+    # saving running games to continue them after a restart
+    await mg.save_state_async()
+
+
+@tasks.loop(minutes=1)
+async def unload_languages():
+    # freeing languages nobody plays in
+    mg.unload_languages()
 
 
 # events
@@ -85,6 +129,15 @@ async def check():
 async def on_ready():
     log('Ready!', level=SUCCESS)
 
+    if not flush.is_running():
+        flush.start()
+
+    if not save_state.is_running():
+        save_state.start()
+
+    if not unload_languages.is_running():
+        unload_languages.start()
+
     if not check.is_running():
         await check.start()
 
@@ -105,51 +158,50 @@ async def on_resumed():
 # callback
 
 async def edit_finish_msg(message:discord.Message, r:api.Reaction):
-    # creating new view
-    view = discord.ui.View(timeout=config.GAME_LENGTH)
-
-    btn = discord.ui.Button(
-        style=discord.ButtonStyle.blurple,
-        label='Хочу быть ведущим!',
-        emoji='✋'
-    )
-    btn.callback = new_game
-
-    like_btn = discord.ui.Button(
-        style=discord.ButtonStyle.green,
-        label=f'{len(r.likes)}', emoji='👍'
-    )
-    like_btn.callback = like_callback
-
-    dislike_btn = discord.ui.Button(
-        style=discord.ButtonStyle.red,
-        label=f'{len(r.dislikes)}', emoji='👎'
-    )
-    dislike_btn.callback = dislike_callback
-
-    view.add_item(btn)
-    view.add_item(like_btn)
-    view.add_item(dislike_btn)
-
     # editing embed
     embed = message.embeds[0]
     embed.clear_fields()
 
-    if r.likes != []:
+    if r.likes:
         embed.add_field(
             name=f'👍 {len(r.likes)}',
             value='\n'.join([f":white_small_square: <@{i}>" for i in r.likes]),
             inline=True
         )
 
-    if r.dislikes != []:
+    if r.dislikes:
         embed.add_field(
             name=f'👎 {len(r.dislikes)}',
             value='\n'.join([f":white_small_square: <@{i}>" for i in r.dislikes]),
             inline=True
         )
 
-    await message.edit(embed=embed, view=view)
+    await message.edit(embed=embed)
+
+
+# message ID: whether reactions changed during the edit in progress
+finish_edits: Dict[int, bool] = {}
+
+async def update_finish_msg(message:discord.Message, r:api.Reaction):
+    '''
+    Shows the current reactions in the message.
+
+    Only one edit per message is done at a time. If reactions
+    change during it, one more edit is done after it
+    with the latest reactions.
+    '''
+    if message.id in finish_edits:
+        finish_edits[message.id] = True
+        return
+    
+    finish_edits[message.id] = True
+
+    try:
+        while finish_edits[message.id]:
+            finish_edits[message.id] = False
+            await edit_finish_msg(message, r)
+    finally:
+        finish_edits.pop(message.id)
 
 
 # on_message event
@@ -159,8 +211,14 @@ async def on_message(message:discord.Message):
     # no not bots that's not, no.
     if message.author.bot:
         return
+
+    # most messages are neither commands nor in a channel with a game
+    is_command: bool = message.content.startswith(PREFIX)
+    if not is_command and message.channel.id not in mg.games:
+        return
     
-    await bot.process_commands(message)
+    if is_command:
+        await bot.process_commands(message)
 
     # checking for ongoing game
     game = mg.get_game(message.channel.id)
@@ -168,37 +226,18 @@ async def on_message(message:discord.Message):
         return
     
     # checking if guess is correct
-    if game.word.lower() == message.content.lower().strip().replace('ё','е'):
-        game, guesser_events, explainer_events = mg.word_guessed(
-            message.channel.id,
-            message.guild.id,
-            message.author.id
-        )
-        # creating view
-        view = discord.ui.View(timeout=config.GAME_LENGTH)
-
-        btn = discord.ui.Button(
-            style=discord.ButtonStyle.blurple,
-            label='Хочу быть ведущим!',
-            emoji='✋'
-        )
-        btn.callback = new_game
-
-        like_btn = discord.ui.Button(
-            style=discord.ButtonStyle.green,
-            label='0', emoji='👍'
-        )
-        like_btn.callback = like_callback
-
-        dislike_btn = discord.ui.Button(
-            style=discord.ButtonStyle.red,
-            label='0', emoji='👎'
-        )
-        dislike_btn.callback = dislike_callback
-
-        view.add_item(btn)
-        view.add_item(like_btn)
-        view.add_item(dislike_btn)
+    if utils.is_guess(message.content, game.word):
+        # the game goes on if shared users are busy,
+        # so the next right guess finishes it
+        try:
+            game, guesser_events, explainer_events = mg.word_guessed(
+                message.channel.id,
+                message.guild.id,
+                message.author.id
+            )
+        except sqlite3.OperationalError as e:
+            log(f'Failed writing guessed word in {message.channel.id}: {e}', level=ERROR)
+            return
 
         # creating embed
         footer = f'+{len(game.word)} XP для {message.author.name} и {game.starter_name}'
@@ -216,7 +255,7 @@ async def on_message(message:discord.Message):
             color=discord.Color.green()
         )
         embed.set_footer(text=footer)
-        msg = await message.reply(embed=embed, view=view)
+        msg = await message.reply(embed=embed, view=views['finish'])
 
         # adding reference
         mg.add_reactions(msg.id, game.starter_id)
@@ -238,6 +277,7 @@ async def reload(ctx:commands.Context):
     )
     message = await ctx.reply(embed=embed)
 
+    await mg.flush_async()
     mg.load_data()
     mg.load_users()
     log(f'Reloaded!', level=SUCCESS)
@@ -277,6 +317,27 @@ async def sync(ctx:commands.Context):
 
 
 
+# memory stats command
+
+@bot.command()
+async def memory(ctx:commands.Context):
+    if ctx.author.id not in config.ADMINS:
+        return
+    
+    log(f'{ctx.author.id} ran {PREFIX}memory')
+
+    stats: Dict[str, int] = mg.get_stats()
+
+    embed = discord.Embed(
+        description='\n'.join([
+            f':white_small_square: {key}: **{value}**' for key, value in stats.items()
+        ]),
+        color=discord.Color.green()
+    )
+    await ctx.reply(embed=embed)
+
+
+
 # take money command
 
 @bot.command()
@@ -306,18 +367,42 @@ async def steal(ctx:commands.Context, user:discord.User, amount:int):
     await ctx.reply(embed=embed)
 
 
+# hide from global leaderboards command
+
+@bot.command()
+async def hide(ctx:commands.Context, user:discord.User):
+    if ctx.author.id not in config.ADMINS:
+        return
+    
+    log(f'{ctx.author.id} ran {PREFIX}hide')
+
+    bot_user = mg.users.get(user.id)
+    hidden: bool = bot_user == None or not bot_user.hidden
+    mg.set_hidden(user.id, hidden)
+
+    text = 'скрыт(а) из' if hidden else 'снова показан(а) в'
+    embed = discord.Embed(
+        description=f'✅ <@{user.id}> {text} глобальной таблице лидеров!',
+        color=discord.Color.green()
+    )
+    await ctx.reply(embed=embed)
+
+
 # like callback
 
 async def like_callback(inter: discord.Interaction):
     # liking
-    state = mg.like(inter.message.id, inter.user.id)
+    state, r = mg.like(inter.message.id, inter.user.id)
 
     # game not found
     if state == None:
+        embed = discord.Embed(
+            description=f'🚫 Голосование за это объяснение уже закончилось!',
+            color=discord.Color.red()
+        )
+        await inter.response.send_message(embed=embed, ephemeral=True)
         return
     
-    r = mg.reactions[inter.message.id]
-
     # error message
     if state != 0:
         text = [
@@ -340,7 +425,7 @@ async def like_callback(inter: discord.Interaction):
     await inter.response.send_message(embed=embed, ephemeral=True)
 
     # editing original message
-    await edit_finish_msg(inter.message, r)
+    await update_finish_msg(inter.message, r)
 
 
 
@@ -348,14 +433,17 @@ async def like_callback(inter: discord.Interaction):
 
 async def dislike_callback(inter: discord.Interaction):
     # disliking
-    state = mg.dislike(inter.message.id, inter.user.id)
+    state, r = mg.dislike(inter.message.id, inter.user.id)
 
     # game not found
     if state == None:
+        embed = discord.Embed(
+            description=f'🚫 Голосование за это объяснение уже закончилось!',
+            color=discord.Color.red()
+        )
+        await inter.response.send_message(embed=embed, ephemeral=True)
         return
     
-    r = mg.reactions[inter.message.id]
-    
     # error message
     if state != 0:
         text = [
@@ -378,7 +466,7 @@ async def dislike_callback(inter: discord.Interaction):
     await inter.response.send_message(embed=embed, ephemeral=True)
 
     # editing original message
-    await edit_finish_msg(inter.message, r)
+    await update_finish_msg(inter.message, r)
 
 
 
@@ -439,17 +527,6 @@ async def skip_word(inter: discord.Interaction):
     word, events = mg.new_word(inter.user.id, inter.channel_id, inter.guild_id)
     log(f'{inter.user.id} changed word to {word}')
     
-    # creating view
-    view = discord.ui.View(timeout=config.GAME_LENGTH)
-
-    skip_btn = discord.ui.Button(
-        style=discord.ButtonStyle.gray,
-        label='Новое слово',
-        emoji='⏩'
-    )
-    skip_btn.callback = skip_word
-    view.add_item(skip_btn)
-
     # sending the new word
     embed = discord.Embed(
         description=f'📜 Новое слово - **{word}**',
@@ -458,7 +535,7 @@ async def skip_word(inter: discord.Interaction):
     if events != []:
         embed.set_footer(text=utils.events_to_text(inter.user.name, events))
     
-    await inter.response.send_message(embed=embed, view=view, ephemeral=True)
+    await inter.response.send_message(embed=embed, view=views['skip'], ephemeral=True)
 
 
 
@@ -485,27 +562,16 @@ async def end_turn(inter: discord.Interaction):
         return
     
     # ending game
-    mg.games.pop(game.channel_id)
+    mg.stop_game(game.channel_id)
     log(f'{inter.user.id} removed game in {game.channel_id}')
     
-    # creating view
-    view = discord.ui.View(timeout=config.GAME_LENGTH)
-
-    new_game_btn = discord.ui.Button(
-        style=discord.ButtonStyle.blurple,
-        label='Играть ещё',
-        emoji='🎮'
-    )
-    new_game_btn.callback = new_game
-    view.add_item(new_game_btn)
-
     # sending the message
     embed = discord.Embed(
         description=f'🤚 <@{game.starter_id}> пропустил свой ход!',
         color=discord.Color.green()
     )
     
-    await inter.response.send_message(embed=embed, view=view)
+    await inter.response.send_message(embed=embed, view=views['play_again'])
 
 
 
@@ -547,33 +613,6 @@ async def new_game(inter: discord.Interaction):
     )
     await inter.response.send_message(embed=embed, ephemeral=True)
 
-    # creating view
-    view = discord.ui.View(timeout=config.GAME_LENGTH)
-
-    view_btn = discord.ui.Button(
-        style=discord.ButtonStyle.blurple,
-        label='Посмотреть слово',
-        emoji='📜'
-    )
-    view_btn.callback = view_word
-    view.add_item(view_btn)
-
-    skip_btn = discord.ui.Button(
-        style=discord.ButtonStyle.gray,
-        label='Новое слово',
-        emoji='⏩'
-    )
-    skip_btn.callback = skip_word
-    view.add_item(skip_btn)
-
-    turn_btn = discord.ui.Button(
-        style=discord.ButtonStyle.red,
-        label='Пропустить ход',
-        emoji='❌'
-    )
-    turn_btn.callback = end_turn
-    view.add_item(turn_btn)
-
     # creating embed
     embed = discord.Embed(
         description=f'💭 <@{inter.user.id}> загадывает слово!',
@@ -582,7 +621,80 @@ async def new_game(inter: discord.Interaction):
     if events != []:
         embed.set_footer(text=utils.events_to_text(inter.user.name, events))
 
-    await inter.channel.send(embed=embed, view=view)
+    await inter.channel.send(embed=embed, view=views['game'])
+
+
+
+# persistent views
+
+# view name: buttons as (custom ID, style, label, emoji, callback)
+VIEW_BUTTONS: Dict[str, List[Tuple[str, discord.ButtonStyle, "str | None", str, Callable]]] = {
+    'play_again': [
+        ('play_again:new_game', discord.ButtonStyle.blurple, 'Играть ещё', '🎮', new_game),
+    ],
+    'finish': [
+        ('finish:new_game', discord.ButtonStyle.blurple, 'Хочу быть ведущим!', '✋', new_game),
+        ('finish:like', discord.ButtonStyle.green, None, '👍', like_callback),
+        ('finish:dislike', discord.ButtonStyle.red, None, '👎', dislike_callback),
+    ],
+    'game': [
+        ('game:view_word', discord.ButtonStyle.blurple, 'Посмотреть слово', '📜', view_word),
+        ('game:skip_word', discord.ButtonStyle.gray, 'Новое слово', '⏩', skip_word),
+        ('game:end_turn', discord.ButtonStyle.red, 'Пропустить ход', '❌', end_turn),
+    ],
+    'word': [
+        ('word:view_word', discord.ButtonStyle.blurple, 'Посмотреть слово', '📜', view_word),
+        ('word:skip_word', discord.ButtonStyle.gray, 'Новое слово', '⏩', skip_word),
+    ],
+    'skip': [
+        ('skip:skip_word', discord.ButtonStyle.gray, 'Новое слово', '⏩', skip_word),
+    ],
+}
+
+# views sent in messages by name
+views: Dict[str, discord.ui.View] = {}
+
+
+def make_view(
+    buttons:List[Tuple[str, discord.ButtonStyle, "str | None", str, Callable]]
+) -> discord.ui.View:
+    '''
+    Creates a view that never times out with the buttons.
+    '''
+    view = discord.ui.View(timeout=None)
+
+    for custom_id, style, label, emoji, callback in buttons:
+        btn = discord.ui.Button(
+            style=style, label=label, emoji=emoji, custom_id=custom_id
+        )
+        btn.callback = callback
+        view.add_item(btn)
+
+    return view
+
+
+@bot.event
+async def setup_hook():
+    # views can only be created with the event loop running
+    for name, buttons in VIEW_BUTTONS.items():
+        # handles clicks on these buttons in every message,
+        # the game state is found by the channel or message ID
+        bot.add_view(make_view(buttons))
+
+        # sent in messages, it's stopped so discord.py
+        # doesn't keep track of every message it's sent in
+        views[name] = make_view(buttons)
+        views[name].stop()
+
+    # shutting down properly when asked to by systemd, docker or cluster.py,
+    # so that everything gets written after bot.run returns
+    try:
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGTERM, lambda: asyncio.create_task(bot.close())
+        )
+    except NotImplementedError:
+        # not supported on windows
+        pass
 
 
 
@@ -618,25 +730,6 @@ async def changeword(ctx:commands.Context):
     word, events = mg.new_word(ctx.author.id, ctx.channel.id, ctx.guild.id)
     log(f'{ctx.author.id} changed word to {word}')
     
-    # creating view
-    view = discord.ui.View(timeout=config.GAME_LENGTH)
-
-    view_btn = discord.ui.Button(
-        style=discord.ButtonStyle.blurple,
-        label='Посмотреть слово',
-        emoji='📜'
-    )
-    view_btn.callback = view_word
-    view.add_item(view_btn)
-
-    skip_btn = discord.ui.Button(
-        style=discord.ButtonStyle.gray,
-        label='Новое слово',
-        emoji='⏩'
-    )
-    skip_btn.callback = skip_word
-    view.add_item(skip_btn)
-
     # sending the new word
     embed = discord.Embed(
         description=f'📜 Нажми на кнопку, чтобы посмотреть новое слово',
@@ -644,7 +737,7 @@ async def changeword(ctx:commands.Context):
     )
     if events != []:
         embed.set_footer(text=utils.events_to_text(ctx.author.name, events))
-    await ctx.reply(embed=embed, view=view)
+    await ctx.reply(embed=embed, view=views['word'])
 
 
 
@@ -677,26 +770,15 @@ async def skip(ctx:commands.Context):
         return
     
     # ending game
-    mg.games.pop(game.channel_id)
+    mg.stop_game(game.channel_id)
     log(f'{ctx.author.id} removed game in {game.channel_id}')
     
-    # creating view
-    view = discord.ui.View(timeout=config.GAME_LENGTH)
-
-    new_game_btn = discord.ui.Button(
-        style=discord.ButtonStyle.blurple,
-        label='Играть ещё',
-        emoji='🎮'
-    )
-    new_game_btn.callback = new_game
-    view.add_item(new_game_btn)
-
     # sending the message
     embed = discord.Embed(
         description=f'🤚 <@{game.starter_id}> пропустил свой ход!',
         color=discord.Color.green()
     )
-    await ctx.reply(embed=embed, view=view)
+    await ctx.reply(embed=embed, view=views['play_again'])
 
 
 
@@ -736,33 +818,6 @@ async def start(ctx:commands.Context):
         ctx.message.id, ctx.author.id, ctx.author.name
     )
 
-    # creating view
-    view = discord.ui.View(timeout=config.GAME_LENGTH)
-
-    view_btn = discord.ui.Button(
-        style=discord.ButtonStyle.blurple,
-        label='Посмотреть слово',
-        emoji='📜'
-    )
-    view_btn.callback = view_word
-    view.add_item(view_btn)
-
-    skip_btn = discord.ui.Button(
-        style=discord.ButtonStyle.gray,
-        label='Новое слово',
-        emoji='⏩'
-    )
-    skip_btn.callback = skip_word
-    view.add_item(skip_btn)
-
-    turn_btn = discord.ui.Button(
-        style=discord.ButtonStyle.red,
-        label='Пропустить ход',
-        emoji='❌'
-    )
-    turn_btn.callback = end_turn
-    view.add_item(turn_btn)
-
     # creating embed
     embed = discord.Embed(
         description=f'💭 <@{ctx.author.id}> загадывает слово!',
@@ -771,7 +826,7 @@ async def start(ctx:commands.Context):
     if events != []:
         embed.set_footer(text=utils.events_to_text(ctx.author.name, events))
 
-    await ctx.reply(embed=embed, view=view)
+    await ctx.reply(embed=embed, view=views['game'])
 
 
 
@@ -841,6 +896,20 @@ async def profile(ctx:commands.Context, user:discord.User=None):
             f':white_small_square: Дизлайков: **{bot_user.dislikes}**',
         inline=False
     )
+
+    # places on leaderboards
+    places = ''
+    guild_place = mg.guilds[ctx.guild.id].get_rank(user.id)\
+        if ctx.guild != None and ctx.guild.id in mg.guilds else None
+    global_place = await mg.get_global_rank_async(user.id, 'xp')
+
+    if guild_place != None:
+        places += f':white_small_square: На этом сервере: **#{guild_place}** по угадываниям\n'
+    if global_place != None:
+        places += f':white_small_square: Глобально: **#{global_place}** по опыту'
+
+    if places != '':
+        embed.add_field(name=f'🏆 Место в топе', value=places, inline=False)
     embed.add_field(
         name=f'⌚ Начал(а) играть',
         value=f':white_small_square: <t:{int(bot_user.started_playing)}> (<t:{int(bot_user.started_playing)}:R>)'
@@ -885,14 +954,8 @@ async def leaders(ctx:commands.Context, places:int=10):
     leaders = guild.get_leaderboard(places)
     leader_text = ''
 
-    place = 0
-    old_amount = 0
-
     for id, amount in leaders.items():
-        if old_amount != amount:
-            place += 1
-            old_amount = amount
-
+        place = guild.get_rank(id)
         text = ['`🥇`','`🥈`','`🥉`']\
             [place-1] if place <= 3 else f'`#{place}`'
         leader_text += f'{text} <@{id}>  -  **`{amount}`**\n'
@@ -909,6 +972,89 @@ async def leaders(ctx:commands.Context, places:int=10):
 
 
 
+# global leaderboard command
+
+# stat: (name in the title, emoji)
+GLOBAL_STATS: Dict[str, Tuple[str, str]] = {
+    'xp': ('опыту', '✨'),
+    'moonrocks': ('лунным камням', '💎'),
+    'words_guessed': ('угадываниям', '📜'),
+}
+
+@bot.hybrid_command(
+    name='top',
+    description='Показывает таблицу лидеров среди всех серверов.',
+    aliases=['global','globallb']
+)
+@discord.app_commands.describe(
+    stat='Что сравнивать: xp, moonrocks или words_guessed',
+    places='Кол-во мест (10 по умолчанию)'
+)
+async def top(ctx:commands.Context, stat:str='xp', places:int=10):
+    log(f'{ctx.author.id} ran {PREFIX}top')
+
+    # checking stat
+    if stat not in GLOBAL_STATS:
+        embed = discord.Embed(
+            description=f'🚫 Можно сравнивать только '\
+                f'{", ".join([f"`{i}`" for i in GLOBAL_STATS])}!',
+            color=discord.Color.red()
+        )
+        await ctx.reply(embed=embed)
+        return
+    
+    # checking amount
+    if places < 1 or places > 20:
+        embed = discord.Embed(
+            description=f'🚫 Можно запросить от 1 до 20 мест!',
+            color=discord.Color.red()
+        )
+        await ctx.reply(embed=embed)
+        return
+
+    # haven't played yet
+    leaders = mg.get_global_leaderboard(stat, places)
+    if len(leaders) == 0:
+        embed = discord.Embed(
+            description=f'🚫 Еще никто не играл в Крокодила!',
+            color=discord.Color.red()
+        )
+        await ctx.reply(embed=embed)
+        return
+    
+    # getting leaders
+    name, emoji = GLOBAL_STATS[stat]
+    leader_text = ''
+
+    # leaders are sorted, so tied ones share the place of the first of them
+    place = 0
+    last_amount = None
+
+    for index, (id, amount) in enumerate(leaders.items()):
+        if amount != last_amount:
+            place = index+1
+            last_amount = amount
+
+        text = ['`🥇`','`🥈`','`🥉`']\
+            [place-1] if place <= 3 else f'`#{place}`'
+        leader_text += f'{text} <@{id}>  -  **`{amount}`** {emoji}\n'
+
+    embed = discord.Embed(color=discord.Color.green())
+    embed.add_field(
+        name=f'Глобальная таблица лидеров по {name}',
+        value=leader_text
+    )
+
+    # showing the author's place if not on the list
+    if ctx.author.id not in leaders:
+        place = await mg.get_global_rank_async(ctx.author.id, stat)
+        if place != None:
+            embed.set_footer(text=f'Ваше место: #{place}')
+
+    await ctx.reply(embed=embed)
+
+
+
 # transfer command
 
 @bot.hybrid_command(
@@ -969,4 +1115,10 @@ async def pay(ctx:commands.Context, user:discord.User, amount:str):
 
 # running bot
 
-bot.run(TOKEN)
\ No newline at end of file
+try:
+    bot.run(TOKEN)
+
+# writing everything that's left, even if the bot crashed
+finally:
+    mg.close()
+    log('Shut down', level=SUCCESS)
\ No newline at end of file
@@ -0,0 +1,195 @@
+import bisect
+from array import array
+from typing import *
+
+
+# max amount of entries in a block before it's split in two
+BLOCK_SIZE: int = 1024
+
+
+class RankIndex:
+    def __init__(self, scores:Iterable[Tuple[int, int]]=()):
+        '''
+        Keeps IDs sorted by score, highest score first,
+        from (ID, score) pairs.
+
+        Entries are kept in blocks of typed arrays sorted by score
+        and then by ID, so adding or removing one only moves
+        the rest of its block. A Fenwick tree over block sizes
+        counts the entries before a block in O(log n).
+
+        Scores aren't stored by ID, the caller passes
+        the current score when moving or removing an ID.
+        '''
+        entries: List[Tuple[int, int]] = sorted([(-score, id) for id, score in scores])
+
+        # negated scores and IDs of every block
+        self.scores: List[array] = []
+        self.ids: List[array] = []
+
+        for i in range(0, len(entries), BLOCK_SIZE//2):
+            block: List[Tuple[int, int]] = entries[i:i+BLOCK_SIZE//2]
+            self.scores.append(array('q', [i[0] for i in block]))
+            self.ids.append(array('Q', [i[1] for i in block]))
+
+        self.length: int = len(entries)
+        self.rebuild()
+
+
+    def __len__(self) -> int:
+        return self.length
+
+
+    def rebuild(self):
+        '''
+        Rebuilds the last entries of blocks and the tree
+        after blocks are added or removed.
+        '''
+        # the last (negated score, ID) of every block
+        self.lasts: List[Tuple[int, int]] = [
+            (scores[-1], ids[-1]) for scores, ids in zip(self.scores, self.ids)
+        ]
+
+        self.tree: List[int] = [0]*(len(self.scores)+1)
+        for i, scores in enumerate(self.scores):
+            self.update_tree(i, len(scores))
+
+
+    def update_tree(self, block:int, amount:int):
+        '''
+        Adds the amount to the size of the block in the tree.
+        '''
+        block += 1
+        while block < len(self.tree):
+            self.tree[block] += amount
+            block += block & -block
+
+
+    def count_before(self, block:int) -> int:
+        '''
+        Returns the amount of entries in blocks before the block.
+        '''
+        total: int = 0
+        while block > 0:
+            total += self.tree[block]
+            block -= block & -block
+        return total
+
+
+    def find_block(self, key:Tuple[int, int]) -> int:
+        '''
+        Returns the block the key belongs to.
+        '''
+        return min(bisect.bisect_left(self.lasts, key), len(self.lasts)-1)
+
+
+    def find(self, block:int, score:int, id:int) -> int:
+        '''
+        Returns the position the entry has or would have in the block.
+        '''
+        scores: array = self.scores[block]
+        start: int = bisect.bisect_left(scores, -score)
+        end: int = bisect.bisect_right(scores, -score, start)
+
+        return bisect.bisect_left(self.ids[block], id, start, end)
+
+
+    def add(self, id:int, score:int):
+        '''
+        Adds the ID with the score.
+        '''
+        self.length += 1
+
+        if not self.scores:
+            self.scores.append(array('q', [-score]))
+            self.ids.append(array('Q', [id]))
+            self.rebuild()
+            return
+
+        block: int = self.find_block((-score, id))
+        position: int = self.find(block, score, id)
+
+        self.scores[block].insert(position, -score)
+        self.ids[block].insert(position, id)
+
+        # splitting blocks that got too big
+        if len(self.scores[block]) > BLOCK_SIZE:
+            half: int = BLOCK_SIZE//2
+            self.scores.insert(block+1, self.scores[block][half:])
+            self.ids.insert(block+1, self.ids[block][half:])
+            del self.scores[block][half:]
+            del self.ids[block][half:]
+            self.rebuild()
+            return
+
+        self.lasts[block] = (self.scores[block][-1], self.ids[block][-1])
+        self.update_tree(block, 1)
+
+
+    def remove(self, id:int, score:int):
+        '''
+        Removes the ID that has the score.
+        '''
+        if not self.scores:
+            raise KeyError(id)
+
+        block: int = self.find_block((-score, id))
+        position: int = self.find(block, score, id)
+
+        if position >= len(self.ids[block]) or self.ids[block][position] != id\
+            or self.scores[block][position] != -score:
+                raise KeyError(id)
+
+        self.length -= 1
+        del self.scores[block][position]
+        del self.ids[block][position]
+
+        if not self.scores[block]:
+            del self.scores[block]
+            del self.ids[block]
+            self.rebuild()
+            return
+
+        self.lasts[block] = (self.scores[block][-1], self.ids[block][-1])
+        self.update_tree(block, -1)
+
+
+    def move(self, id:int, old_score:int, new_score:int):
+        '''
+        Changes the score of the ID.
+        '''
+        if old_score == new_score:
+            return
+
+        self.remove(id, old_score)
+        self.add(id, new_score)
+
+
+    def get_rank(self, score:int) -> int:
+        '''
+        Returns the place of an ID with the score, starting from 1.
+        IDs with the same score share the place.
+        '''
+        if not self.scores:
+            return 1
+
+        # the first entry with this score or a lower one
+        block: int = min(
+            bisect.bisect_left(self.lasts, (-score, -1)), len(self.lasts)-1
+        )
+        return self.count_before(block)\
+            +bisect.bisect_left(self.scores[block], -score)+1
+
+
+    def get_top(self, amount:int) -> List[Tuple[int, int]]:
+        '''
+        Returns the IDs with the highest scores as (ID, score) pairs.
+        '''
+        top: List[Tuple[int, int]] = []
+
+        for scores, ids in zip(self.scores, self.ids):
+            if len(top) >= amount:
+                break
+            top.extend(zip(ids, [-i for i in scores]))
+
+        return top[:amount]
@@ -0,0 +1,206 @@
+import time
+import heapq
+import asyncio
+import itertools
+from collections import OrderedDict
+from typing import *
+
+
+class Deadlines:
+    def __init__(self):
+        '''
+        A heap of deadlines by key.
+
+        Cancelled deadlines are only marked as such and skipped
+        when they reach the top of the heap, so adding and
+        cancelling both take O(log n) at most.
+        '''
+        self.heap: List[list] = []
+        self.entries: Dict[Hashable, list] = {}
+        self.counter = itertools.count()
+
+        # set when the earliest deadline changes
+        self.changed = asyncio.Event()
+
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+    def add(self, key:Hashable, until:float):
+        '''
+        Schedules a deadline, replacing the previous one with this key.
+        '''
+        self.cancel(key)
+
+        entry: list = [until, next(self.counter), key, True]
+        self.entries[key] = entry
+        heapq.heappush(self.heap, entry)
+
+        if self.heap[0] is entry:
+            self.changed.set()
+
+
+    def add_many(self, deadlines:Iterable[Tuple[Hashable, float]]):
+        '''
+        Schedules (key, time) deadlines, replacing the previous ones
+        with these keys. Takes O(n) instead of O(n log n).
+        '''
+        for key, until in deadlines:
+            old: "list | None" = self.entries.pop(key, None)
+            if old != None:
+                old[3] = False
+
+            entry: list = [until, next(self.counter), key, True]
+            self.entries[key] = entry
+            self.heap.append(entry)
+
+        heapq.heapify(self.heap)
+        self.changed.set()
+
+
+    def cancel(self, key:Hashable):
+        '''
+        Cancels the deadline with this key if there is one.
+        '''
+        entry: "list | None" = self.entries.pop(key, None)
+        if entry == None:
+            return
+
+        entry[3] = False
+
+        if self.heap[0] is entry:
+            self.changed.set()
+
+
+    def get_next(self) -> "float | None":
+        '''
+        Returns the earliest deadline or None if there are none.
+        '''
+        # dropping cancelled deadlines
+        while self.heap and not self.heap[0][3]:
+            heapq.heappop(self.heap)
+
+        if not self.heap:
+            return None
+        return self.heap[0][0]
+
+
+    def pop_expired(self, now:float) -> List[Hashable]:
+        '''
+        Removes the deadlines that passed and returns their keys.
+        '''
+        keys: List[Hashable] = []
+
+        while True:
+            until: "float | None" = self.get_next()
+            if until == None or until > now:
+                return keys
+
+            _, _, key, _ = heapq.heappop(self.heap)
+            self.entries.pop(key)
+            keys.append(key)
+
+
+    async def wait(self):
+        '''
+        Sleeps until the earliest deadline passes
+        or an earlier one is scheduled.
+        '''
+        self.changed.clear()
+        until: "float | None" = self.get_next()
+
+        timeout: "float | None" = None if until == None\
+            else max(0, until-time.time())
+
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class ExpiringDict:
+    def __init__(self, ttl:float, limit:int):
+        '''
+        A dict whose items are removed `ttl` seconds after being set,
+        or earlier if there are more than `limit` of them.
+
+        Every item lives for the same time, so the oldest item is always
+        the first to expire and removing it takes O(1).
+        '''
+        self.ttl: float = ttl
+        self.limit: int = limit
+        self.evictions: int = 0
+
+        # key: (expiry time, value), oldest first
+        self.items: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+
+    def evict(self):
+        '''
+        Removes expired items and items over the limit.
+        '''
+        now: float = time.time()
+
+        while self.items and (
+            len(self.items) > self.limit or next(iter(self.items.values()))[0] <= now
+        ):
+            self.items.popitem(last=False)
+            self.evictions += 1
+
+
+    def __setitem__(self, key:Hashable, value:Any):
+        self.items.pop(key, None)
+        self.items[key] = (time.time()+self.ttl, value)
+        self.evict()
+
+
+    def __getitem__(self, key:Hashable) -> Any:
+        self.evict()
+        return self.items[key][1]
+
+
+    def __contains__(self, key:Hashable) -> bool:
+        self.evict()
+        return key in self.items
+
+
+    def __len__(self) -> int:
+        self.evict()
+        return len(self.items)
+
+
+    def get(self, key:Hashable, default:Any=None) -> Any:
+        self.evict()
+        item: "Tuple[float, Any] | None" = self.items.get(key)
+        return default if item == None else item[1]
+
+
+    def set_until(self, key:Hashable, value:Any, until:float):
+        '''
+        Sets an item that expires at the specified time.
+
+        Items have to be set in the order they expire in,
+        like the ones returned by `get_items`.
+        '''
+        self.items.pop(key, None)
+        self.items[key] = (until, value)
+        self.evict()
+
+
+    def get_items(self) -> List[Tuple[Hashable, float, Any]]:
+        '''
+        Returns the items as (key, expiry time, value), oldest first.
+        '''
+        self.evict()
+        return [(key, i[0], i[1]) for key, i in self.items.items()]
+
+
+    def pop(self, key:Hashable, default:Any=None) -> Any:
+        item: "Tuple[float, Any] | None" = self.items.pop(key, None)
+        return default if item == None else item[1]
+
+
+    def values(self) -> List[Any]:
+        self.evict()
+        return [i[1] for i in self.items.values()]
@@ -0,0 +1,820 @@
+import os
+import sys
+import json
+import shutil
+import sqlite3
+import tempfile
+import contextlib
+from abc import ABC, abstractmethod
+import threading
+from collections.abc import MutableMapping
+from typing import *
+from log import *
+from config import *
+
+
+# helpers
+
+def sync_directory(path:str):
+    '''
+    Writes the directory entries of the folder to disk,
+    so that renames into it survive a crash.
+    '''
+    # directories can't be opened on windows, which syncs them anyway
+    if os.name == 'nt':
+        return
+
+    handle: int = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(handle)
+    finally:
+        os.close(handle)
+
+
+def write_atomic(path:str, text:str):
+    '''
+    Writes text into a file so that the file either has the old
+    or the new contents, even if the process or the system
+    crashes mid-write.
+    '''
+    folder: str = os.path.dirname(path) or '.'
+    handle, temp_path = tempfile.mkstemp(
+        dir=folder, prefix=os.path.basename(path)+'.', suffix='.tmp'
+    )
+
+    try:
+        with os.fdopen(handle, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(temp_path, path)
+
+    except:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    sync_directory(folder)
+
+
+# base
+
+class Storage(ABC):
+    '''
+    Base class for places where user data is stored.
+
+    Data is passed around in the same shape as the JSON database:
+    `{"users": {id: {...}}, "guilds": {id: {...}}}`.
+    Changes are passed as records made by `Manager.flush`.
+
+    Writing methods may be called from a worker thread,
+    but never from more than one thread at a time.
+    '''
+    compact_on_close: bool = False
+
+    # used by other processes too, so it's never rebuilt
+    # from scratch when loading fails
+    shared: bool = False
+
+
+    @abstractmethod
+    def load(self) -> "dict | None":
+        '''
+        Returns all stored data or None if there's no database yet.
+
+        Raises an exception if the database is broken.
+        '''
+
+
+    @abstractmethod
+    def write(self, records:List[dict]):
+        '''
+        Writes the records of modified users and guilds.
+        '''
+
+
+    @abstractmethod
+    def compact(self, data:dict):
+        '''
+        Replaces everything stored with the passed data.
+        '''
+
+
+    def needs_compaction(self) -> bool:
+        '''
+        Returns True if the storage should be compacted.
+        '''
+        return False
+
+
+    @abstractmethod
+    def backup(self):
+        '''
+        Saves the current database into a backup file.
+        '''
+
+
+    def close(self):
+        '''
+        Releases everything the storage holds.
+        '''
+        pass
+
+
+# json
+
+class JSONStorage(Storage):
+    compact_on_close: bool = True
+
+    def __init__(self, path:str):
+        '''
+        Stores data in a JSON snapshot plus an append-only journal
+        of changes made after the snapshot.
+        '''
+        self.path: str = path
+        self.journal_path: str = f'{path}.journal'
+        self.journal_size: int = 0
+
+        # set if a write failed and may have left a broken line
+        self.line_broken: bool = False
+
+
+    def load(self) -> "dict | None":
+        # checking if file exists
+        if not os.path.exists(self.path)\
+            and not os.path.exists(self.journal_path):
+                return None
+
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                raw: dict = json.load(f)
+        else:
+            raw: dict = {"users": {}, "guilds": {}}
+
+        # applying changes made after the last snapshot
+        self.replay_journal(raw)
+        return raw
+
+
+    def replay_journal(self, raw:dict):
+        '''
+        Applies the journal records on top of the raw snapshot data.
+
+        Records hold the full state of a user or a guild field,
+        so replaying the same record twice is harmless.
+        '''
+        self.journal_size = 0
+
+        if not os.path.exists(self.journal_path):
+            return
+
+        log('Replaying journal...', 'api')
+
+        with open(self.journal_path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip() == '':
+                    continue
+
+                # a crash mid-write leaves a broken last line
+                try:
+                    record: dict = json.loads(line)
+                except Exception:
+                    log(f'Skipped broken journal record: {line!r}', 'api', level=WARNING)
+                    continue
+
+                self.journal_size += 1
+
+                # user record
+                if 'u' in record:
+                    raw['users'][str(record['u'])] = record['d']
+                    continue
+
+                # guild record
+                guild: dict = raw['guilds'].setdefault(str(record['g']), {})
+                guild.update(record['d'])
+                guild.setdefault('leaderboard', {}).update(record['l'])
+
+        log(f'Replayed {self.journal_size} journal records', 'api')
+
+
+    def write(self, records:List[dict]):
+        text: str = ''.join([
+            json.dumps(i, ensure_ascii=False, separators=(',',':'))+'\n'
+            for i in records
+        ])
+
+        # not appending to a line left broken by a failed write
+        if self.line_broken:
+            text = '\n'+text
+
+        try:
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+        except:
+            self.line_broken = True
+            raise
+
+        self.line_broken = False
+        self.journal_size += len(records)
+
+
+    def compact(self, data:dict):
+        # not indenting lets json use its C encoder
+        write_atomic(self.path, json.dumps(data, ensure_ascii=False))
+
+        # everything in the journal is in the snapshot now
+        with open(self.journal_path, 'w', encoding='utf-8') as f:
+            os.fsync(f.fileno())
+
+        log(f'Compacted {self.journal_size} journal records', 'api')
+        self.journal_size = 0
+
+
+    def needs_compaction(self) -> bool:
+        return self.journal_size >= JOURNAL_COMPACT_SIZE
+
+
+    def backup(self):
+        shutil.copyfile(self.path, f'{self.path}.bak')
+        log(f'Cloned database into {self.path}.bak', 'api', level=SUCCESS)
+
+
+# sqlite
+
+USER_COLUMNS: Dict[str, str] = {
+    "xp": "INTEGER",
+    "xp_guessed": "INTEGER",
+    "xp_explained": "INTEGER",
+    "moonrocks": "INTEGER",
+    "words_guessed": "INTEGER",
+    "words_explained": "INTEGER",
+    "words_chosen": "INTEGER",
+    "started_playing": "REAL",
+    "likes": "INTEGER",
+    "dislikes": "INTEGER",
+    "hidden": "BOOLEAN",
+}
+
+GUILD_COLUMNS: Dict[str, str] = {
+    "total_words_guessed": "INTEGER",
+    "filter": "BOOLEAN",
+    "language": "TEXT",
+    "bags": "TEXT",
+}
+
+# columns storing JSON values as text
+JSON_COLUMNS: Set[str] = {"bags"}
+
+
+def to_column(key:str, value:Any) -> Any:
+    '''
+    Converts a value into the form it's stored in the database.
+    '''
+    if key in JSON_COLUMNS and value != None:
+        return json.dumps(value, separators=(',',':'))
+    return value
+
+
+def upsert_query(table:str, columns:Dict[str, str]) -> str:
+    '''
+    Returns an SQL query that inserts or updates a row by its ID.
+    '''
+    return f'INSERT INTO {table} (id, {", ".join(columns)}) '\
+        f'VALUES (?{", ?"*len(columns)}) ON CONFLICT (id) DO UPDATE SET '+\
+        ', '.join([f'{i} = excluded.{i}' for i in columns])
+
+
+def create_tables(connection:sqlite3.Connection):
+    '''
+    Creates missing tables and columns in the database.
+    '''
+    with connection:
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY)'
+        )
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS guilds (id INTEGER PRIMARY KEY)'
+        )
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS leaderboard ('\
+            'guild_id INTEGER, user_id INTEGER, guessed INTEGER, '\
+            'PRIMARY KEY (guild_id, user_id)) WITHOUT ROWID'
+        )
+        connection.execute(
+            'CREATE INDEX IF NOT EXISTS leaderboard_guessed '\
+            'ON leaderboard (guild_id, guessed DESC)'
+        )
+
+        # adding columns that appeared after the database was made
+        for table, columns in [('users', USER_COLUMNS), ('guilds', GUILD_COLUMNS)]:
+            existing: Set[str] = {
+                i[1] for i in connection.execute(f'PRAGMA table_info({table})')
+            }
+            for name, kind in columns.items():
+                if name not in existing:
+                    connection.execute(
+                        f'ALTER TABLE {table} ADD COLUMN {name} {kind}'
+                    )
+
+
+def get_shard(guild_id:int, shard_count:int) -> int:
+    '''
+    Returns the shard the guild belongs to.
+    '''
+    return (guild_id >> 22) % shard_count
+
+
+class SQLiteStorage(Storage):
+    def __init__(
+        self, path:str,
+        shard_ids:"List[int] | None"=None,
+        shard_count:"int | None"=None
+    ):
+        '''
+        Stores data in an SQLite database with a row per user,
+        per guild and per guild leaderboard entry.
+
+        If shards are passed, only guilds of these shards are loaded
+        and written, and users are left to `SharedUsers`.
+        This lets cluster workers use the same database.
+        '''
+        self.path: str = path
+        self.connection: sqlite3.Connection = None
+        self.shard_ids: "List[int] | None" = shard_ids
+        self.shard_count: "int | None" = shard_count
+        self.shared: bool = shard_ids != None
+
+        self.upsert_user: str = upsert_query('users', USER_COLUMNS)
+        self.upsert_guild: str = upsert_query('guilds', GUILD_COLUMNS)
+        self.upsert_leader: str =\
+            'INSERT INTO leaderboard (guild_id, user_id, guessed) VALUES (?, ?, ?) '\
+            'ON CONFLICT (guild_id, user_id) DO UPDATE SET guessed = excluded.guessed'
+
+
+    def connect(self) -> bool:
+        '''
+        Opens the database and creates missing tables and columns.
+        Returns False if the database did not exist before.
+        '''
+        existed: bool = os.path.exists(self.path)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        create_tables(self.connection)
+
+        return existed
+
+
+    def get_shard_filter(self, column:str) -> str:
+        '''
+        Returns an SQL condition matching guild IDs in the column
+        that belong to this storage's shards.
+        '''
+        if self.shard_ids == None:
+            return '1'
+        
+        return f'(({column} >> 22) % {int(self.shard_count)}) '\
+            f'IN ({", ".join([str(int(i)) for i in self.shard_ids])})'
+
+
+    def load(self) -> "dict | None":
+        if self.connection == None and not self.connect():
+            return None
+
+        raw: dict = {"users": {}, "guilds": {}}
+        user_names: List[str] = list(USER_COLUMNS)
+        guild_names: List[str] = list(GUILD_COLUMNS)
+
+        # users, unless they're shared between cluster workers
+        for row in self.connection.execute(
+            f'SELECT id, {", ".join(user_names)} FROM users'
+        ) if self.shard_ids == None else []:
+            raw['users'][row[0]] = {
+                key: value for key, value in zip(user_names, row[1:])
+                if value != None
+            }
+
+        # guilds
+        for row in self.connection.execute(
+            f'SELECT id, {", ".join(guild_names)} FROM guilds '\
+            f'WHERE {self.get_shard_filter("id")}'
+        ):
+            guild: dict = {
+                key: value for key, value in zip(guild_names, row[1:])
+                if value != None
+            }
+            if 'filter' in guild:
+                guild['filter'] = bool(guild['filter'])
+
+            for i in JSON_COLUMNS:
+                if i in guild:
+                    guild[i] = json.loads(guild[i])
+
+            guild['leaderboard'] = {}
+            raw['guilds'][row[0]] = guild
+
+        # leaderboards
+        for guild_id, user_id, guessed in self.connection.execute(
+            'SELECT guild_id, user_id, guessed FROM leaderboard '\
+            f'WHERE {self.get_shard_filter("guild_id")}'
+        ):
+            raw['guilds'].setdefault(guild_id, {'leaderboard': {}})\
+                ['leaderboard'][user_id] = guessed
+
+        return raw
+
+
+    def write(self, records:List[dict]):
+        with self.connection:
+            self.upsert(records)
+
+
+    def upsert(self, records:List[dict]):
+        '''
+        Inserts or updates the rows of the records
+        in the transaction that's open.
+        '''
+        users: List[tuple] = []
+        guilds: List[tuple] = []
+        leaders: List[tuple] = []
+
+        for record in records:
+            if 'u' in record:
+                users.append((record['u'], *[
+                    record['d'].get(i) for i in USER_COLUMNS
+                ]))
+                continue
+
+            guilds.append((record['g'], *[
+                to_column(i, record['d'].get(i)) for i in GUILD_COLUMNS
+            ]))
+            leaders.extend([
+                (record['g'], int(user_id), guessed)
+                for user_id, guessed in record['l'].items()
+            ])
+
+        self.connection.executemany(self.upsert_user, users)
+        self.connection.executemany(self.upsert_guild, guilds)
+        self.connection.executemany(self.upsert_leader, leaders)
+
+
+    def compact(self, data:dict):
+        if self.connection == None:
+            self.connect()
+
+        records: List[dict] = [
+            {"u": int(id), "d": user} for id, user in data['users'].items()
+        ]
+        records.extend([
+            {"g": int(id), "d": guild, "l": guild.get('leaderboard', {})}
+            for id, guild in data['guilds'].items()
+        ])
+
+        # one transaction, so a crash can't leave the tables empty
+        with self.connection:
+            if self.shard_ids == None:
+                self.connection.execute('DELETE FROM users')
+            self.connection.execute(
+                f'DELETE FROM guilds WHERE {self.get_shard_filter("id")}'
+            )
+            self.connection.execute(
+                f'DELETE FROM leaderboard WHERE {self.get_shard_filter("guild_id")}'
+            )
+            self.upsert(records)
+
+
+    def backup(self):
+        # other cluster workers keep using the database,
+        # so it's copied by sqlite along with the write-ahead log
+        if self.shared:
+            if self.connection == None:
+                self.connect()
+
+            target = sqlite3.connect(f'{self.path}.bak')
+            try:
+                self.connection.backup(target)
+            finally:
+                target.close()
+
+            log(f'Cloned database into {self.path}.bak', 'api', level=SUCCESS)
+            return
+
+        # the database may be broken, so it's moved away entirely,
+        # keeping the write-ahead log next to it
+        self.close()
+
+        for i in ['', '-wal', '-shm']:
+            if os.path.exists(self.path+i):
+                os.replace(self.path+i, f'{self.path}.bak{i}')
+
+        log(f'Moved database into {self.path}.bak', 'api', level=SUCCESS)
+
+
+    def close(self):
+        if self.connection != None:
+            self.connection.close()
+            self.connection = None
+
+
+# shared users
+
+# user columns changed by writing the difference,
+# so changes from different processes add up
+COUNTER_COLUMNS: Set[str] = {
+    name for name, kind in USER_COLUMNS.items() if kind == 'INTEGER'
+}
+
+
+def shared_property(name:str) -> property:
+    '''
+    Returns a property reading the user's value of the column
+    and writing it to the database.
+    '''
+    def get(self:"SharedUser") -> Any:
+        return self.values[name]
+
+    def set(self:"SharedUser", value:Any):
+        if name in COUNTER_COLUMNS:
+            self.store.write(
+                f'UPDATE users SET {name} = COALESCE({name}, 0) + ? WHERE id = ?',
+                (value-self.values[name], self.id)
+            )
+        else:
+            self.store.write(
+                f'UPDATE users SET {name} = ? WHERE id = ?', (value, self.id)
+            )
+
+        self.values[name] = value
+
+    return property(get, set)
+
+
+class SharedUser:
+    __slots__ = ('id', 'store', 'values')
+
+    def __init__(self, store:"SharedUsers", id:int, values:dict):
+        '''
+        A user read from the shared database.
+        Works like `api.User`, every change is written right away
+        or at the end of the store's batch.
+        '''
+        self.id: int = id
+        self.store: SharedUsers = store
+        self.values: dict = values
+
+
+    def to_dict(self) -> dict:
+        return dict(self.values)
+
+
+for name in USER_COLUMNS:
+    setattr(SharedUser, name, shared_property(name))
+
+
+class SharedUsers(MutableMapping):
+    def __init__(
+        self, path:str, indexed:List[str]=[],
+        timeout:float=SHARED_USERS_TIMEOUT
+    ):
+        '''
+        Users stored in an SQLite database shared by cluster workers.
+
+        Works like a dict of users by ID. Every lookup reads
+        the user from the database, so all workers see the same stats.
+        Columns in `indexed` get an index for leaderboards.
+
+        Queries run on the calling thread, so `timeout` is kept short:
+        a write waiting for another worker's write blocks the bot.
+        '''
+        self.path: str = path
+        self.connection = sqlite3.connect(path, isolation_level=None, timeout=timeout)
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        create_tables(self.connection)
+
+        for name in indexed:
+            self.check_column(name)
+            self.connection.execute(
+                f'CREATE INDEX IF NOT EXISTS users_{name} ON users ({name} DESC)'
+            )
+
+        self.names: List[str] = list(USER_COLUMNS)
+        self.select: str = f'SELECT {", ".join(self.names)} FROM users WHERE id = ?'
+        self.insert: str = f'INSERT INTO users (id, {", ".join(self.names)}) '\
+            f'VALUES (?{", ?"*len(self.names)}) ON CONFLICT (id) DO NOTHING'
+
+        # writes of the open batch
+        self.changes: "List[Tuple[str, tuple]] | None" = None
+
+        # slow reads are made from worker threads through their own connection
+        self.reader = sqlite3.connect(path, check_same_thread=False, timeout=timeout)
+        self.reader_lock = threading.Lock()
+
+
+    def check_column(self, name:str):
+        if name not in USER_COLUMNS:
+            raise ValueError(f'Unknown user column {name!r}')
+
+
+    def execute(self, query:str, args:tuple=()) -> sqlite3.Cursor:
+        return self.connection.execute(query, args)
+
+
+    def write(self, query:str, args:tuple=()):
+        '''
+        Runs the changing query right away
+        or at the end of the open batch.
+        '''
+        if self.changes == None:
+            self.execute(query, args)
+        else:
+            self.changes.append((query, args))
+
+
+    @contextlib.contextmanager
+    def batch(self) -> Iterator[None]:
+        '''
+        Collects changes of users made inside and writes them
+        in one transaction at the end, so either all of them
+        are written or none. Nothing is written if the code inside raises.
+
+        Values of users read inside already include the changes
+        made to them, but reading a user again doesn't.
+        Nested batches are written by the outermost one.
+        '''
+        if self.changes != None:
+            yield
+            return
+
+        self.changes = []
+
+        try:
+            yield
+
+            if self.changes:
+                self.execute('BEGIN IMMEDIATE')
+                try:
+                    for query, args in self.changes:
+                        self.execute(query, args)
+                    self.execute('COMMIT')
+
+                except:
+                    self.execute('ROLLBACK')
+                    raise
+
+        finally:
+            self.changes = None
+
+
+    def __len__(self) -> int:
+        return self.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+
+    def __iter__(self) -> Iterator[int]:
+        return (i[0] for i in self.execute('SELECT id FROM users').fetchall())
+
+
+    def __contains__(self, id:object) -> bool:
+        return self.execute('SELECT 1 FROM users WHERE id = ?', (id,)).fetchone() != None
+
+
+    def __getitem__(self, id:int) -> SharedUser:
+        row: "tuple | None" = self.execute(self.select, (id,)).fetchone()
+        if row == None:
+            raise KeyError(id)
+
+        values: dict = {}
+        for name, value in zip(self.names, row):
+            if name == 'hidden':
+                value = bool(value)
+            elif value == None and name in COUNTER_COLUMNS:
+                value = 0
+            values[name] = value
+
+        return SharedUser(self, id, values)
+
+
+    def __setitem__(self, id:int, user:Any):
+        # a user made by another worker in the meantime is kept
+        self.execute(self.insert, (id, *[getattr(user, i) for i in self.names]))
+
+
+    def __delitem__(self, id:int):
+        self.execute('DELETE FROM users WHERE id = ?', (id,))
+
+
+    def transfer(self, from_id:int, to_id:int, name:str, amount:int) -> bool:
+        '''
+        Moves the amount of the column from one user to another
+        in one transaction. Returns False if the first user
+        doesn't have enough.
+        '''
+        self.check_column(name)
+        self.execute('BEGIN IMMEDIATE')
+
+        try:
+            taken: int = self.execute(
+                f'UPDATE users SET {name} = {name} - ? WHERE id = ? AND {name} >= ?',
+                (amount, from_id, amount)
+            ).rowcount
+            if taken:
+                self.execute(
+                    f'UPDATE users SET {name} = COALESCE({name}, 0) + ? WHERE id = ?',
+                    (amount, to_id)
+                )
+            self.execute('COMMIT')
+
+        except:
+            self.execute('ROLLBACK')
+            raise
+
+        return taken == 1
+
+
+    def get_top(self, name:str, amount:int) -> List[Tuple[int, int]]:
+        '''
+        Returns the users who aren't hidden with the highest values
+        in the column as (ID, value) pairs.
+        '''
+        self.check_column(name)
+
+        return self.execute(
+            f'SELECT id, COALESCE({name}, 0) FROM users WHERE NOT COALESCE(hidden, 0) '\
+            f'ORDER BY {name} DESC, id LIMIT ?', (amount,)
+        ).fetchall()
+
+
+    def get_rank(self, id:int, name:str) -> "int | None":
+        '''
+        Returns the user's place by the column among users who aren't hidden
+        or None if the user is hidden or didn't play.
+
+        Users with higher values are counted one by one through the index,
+        so this takes time proportional to the place and may be called
+        from a worker thread.
+        '''
+        self.check_column(name)
+
+        with self.reader_lock:
+            row: "tuple | None" = self.reader.execute(
+                f'SELECT COALESCE({name}, 0), COALESCE(hidden, 0) FROM users WHERE id = ?', (id,)
+            ).fetchone()
+            if row == None or row[1]:
+                return None
+
+            return self.reader.execute(
+                f'SELECT COUNT(*) FROM users WHERE {name} > ? AND NOT COALESCE(hidden, 0)',
+                (row[0],)
+            ).fetchone()[0]+1
+
+
+    def close(self):
+        self.connection.close()
+        self.reader.close()
+
+
+# helpers
+
+STORAGES: Dict[str, Callable[[], Storage]] = {
+    "json": lambda: JSONStorage(USERS_FILE),
+    "sqlite": lambda: SQLiteStorage(SQLITE_FILE),
+}
+
+def get_storage(kind:str=STORAGE) -> Storage:
+    '''
+    Returns the storage of the specified kind.
+    '''
+    if kind not in STORAGES:
+        raise ValueError(f'Unknown storage {kind!r}, expected one of {list(STORAGES)}')
+
+    return STORAGES[kind]()
+
+
+def migrate(json_path:str, sqlite_path:str):
+    '''
+    Imports a JSON database into an SQLite database.
+    '''
+    log(f'Migrating {json_path} into {sqlite_path}...', 'api')
+
+    data: "dict | None" = JSONStorage(json_path).load()
+    if data == None:
+        log(f'{json_path} does not exist', 'api', level=ERROR)
+        return
+
+    target = SQLiteStorage(sqlite_path)
+    target.compact(data)
+    target.close()
+
+    log(
+        f'Migrated {len(data["users"])} users and '\
+        f'{len(data["guilds"])} guilds', 'api', level=SUCCESS
+    )
+
+
+# usage: python storage.py [users.json] [users.db]
+if __name__ == '__main__':
+    migrate(
+        sys.argv[1] if len(sys.argv) > 1 else USERS_FILE,
+        sys.argv[2] if len(sys.argv) > 2 else SQLITE_FILE
+    )
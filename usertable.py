@@ -0,0 +1,248 @@
+import bisect
+import heapq
+import itertools
+import operator
+from array import array
+from collections.abc import MutableMapping
+from typing import *
+
+# numpy only makes aggregates faster, everything works without it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# column: array typecode
+COLUMNS: Dict[str, str] = {
+    "started_playing": "d",
+    "xp": "q",
+    "xp_guessed": "q",
+    "xp_explained": "q",
+    "moonrocks": "q",
+    "words_guessed": "q",
+    "words_explained": "q",
+    "words_chosen": "q",
+    "likes": "q",
+    "dislikes": "q",
+    "hidden": "b",
+}
+
+# columns read back as bools
+BOOL_COLUMNS: Set[str] = {"hidden"}
+
+
+def column_property(name:str) -> property:
+    '''
+    Returns a property reading and writing the view's row of the column.
+    '''
+    convert: Callable[[Any], Any] = bool if name in BOOL_COLUMNS else (lambda x: x)
+
+    def get(self:"UserView") -> Any:
+        return convert(self.table.columns[name][self.row])
+
+    def set(self:"UserView", value:Any):
+        self.table.columns[name][self.row] = value
+
+    return property(get, set)
+
+
+class UserView:
+    __slots__ = ('id', 'table', 'row')
+
+    def __init__(self, table:"UserTable", id:int, row:int):
+        '''
+        A user stored in a table row.
+        Works like `api.User`, reading and writing the table.
+        '''
+        self.id: int = id
+        self.table: UserTable = table
+        self.row: int = row
+
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in COLUMNS}
+
+
+for name in COLUMNS:
+    setattr(UserView, name, column_property(name))
+
+
+class UserTable(MutableMapping):
+    def __init__(self):
+        '''
+        Stores users as columns of typed arrays, a row per user,
+        instead of an object per user.
+
+        Works like a dict of users by ID. Setting a user copies
+        its stats into the table, getting one returns a view
+        of its row. Views are only valid until a user is deleted.
+        '''
+        self.rows: Dict[int, int] = {}
+        self.ids: array = array('Q')
+        self.columns: Dict[str, array] = {
+            name: array(kind) for name, kind in COLUMNS.items()
+        }
+
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.rows)
+
+
+    def __contains__(self, id:object) -> bool:
+        return id in self.rows
+
+
+    def __getitem__(self, id:int) -> UserView:
+        return UserView(self, id, self.rows[id])
+
+
+    def __setitem__(self, id:int, user:Any):
+        row: "int | None" = self.rows.get(id)
+
+        if row == None:
+            self.rows[id] = len(self.ids)
+            self.ids.append(id)
+            for name, column in self.columns.items():
+                column.append(getattr(user, name))
+            return
+
+        for name, column in self.columns.items():
+            column[row] = getattr(user, name)
+
+
+    def __delitem__(self, id:int):
+        # moving the last row in place of the removed one
+        row: int = self.rows.pop(id)
+        last_id: int = self.ids.pop()
+
+        for column in self.columns.values():
+            value: Any = column.pop()
+            if last_id != id:
+                column[row] = value
+
+        if last_id != id:
+            self.ids[row] = last_id
+            self.rows[last_id] = row
+
+
+    def get_column(self, name:str) -> Any:
+        '''
+        Returns the column as a numpy array sharing its memory
+        or as the array itself if numpy isn't installed.
+        '''
+        column: array = self.columns[name]
+
+        if numpy == None:
+            return column
+        return numpy.frombuffer(column, dtype=column.typecode)
+
+
+    def get_total(self, name:str) -> "int | float":
+        '''
+        Returns the sum of the column.
+        '''
+        column: Any = self.get_column(name)
+
+        if numpy == None:
+            return sum(column)
+        return column.sum().item()
+
+
+    def get_top(
+        self, name:str, amount:int, exclude:"str | None"=None
+    ) -> List[Tuple[int, Any]]:
+        '''
+        Returns the IDs with the highest values in the column
+        as (ID, value) pairs, highest first.
+
+        Rows where the `exclude` column is set are skipped.
+        '''
+        if numpy == None:
+            column: array = self.columns[name]
+            excluded: "array | None" = self.columns[exclude] if exclude else None
+
+            # taking enough values to have `amount` left after skipping rows
+            skipped: int = sum(excluded) if excluded != None else 0
+            values: List[Any] = heapq.nlargest(amount+skipped, column)
+            top: List[Tuple[int, Any]] = []
+
+            # finding the rows of the values with scans done in C
+            for value in sorted(set(values), reverse=True):
+                row: int = -1
+                for _ in range(values.count(value)):
+                    row = column.index(value, row+1)
+                    if excluded == None or not excluded[row]:
+                        top.append((self.ids[row], value))
+
+            return top[:amount]
+
+        column = self.get_column(name)
+        rows: Any = None
+
+        if exclude:
+            rows = numpy.flatnonzero(self.get_column(exclude) == 0)
+            column = column[rows]
+
+        amount = min(amount, len(column))
+        if amount == 0:
+            return []
+
+        places = numpy.argpartition(column, -amount)[-amount:]
+        places = places[numpy.argsort(column[places])[::-1]].tolist()
+
+        return [(
+            self.ids[i if rows is None else rows[i].item()], column[i].item()
+        ) for i in places]
+
+
+    def get_rank(
+        self, name:str, value:Any, exclude:"str | None"=None
+    ) -> int:
+        '''
+        Returns the place the value would have in the column,
+        starting from 1. Equal values share the place.
+
+        Rows where the `exclude` column is set are skipped.
+        '''
+        if numpy == None:
+            column: array = self.columns[name]
+
+            # counting with comparisons done in C
+            higher: int = sum(map(operator.gt, column, itertools.repeat(value)))
+
+            if exclude:
+                higher -= sum(map(
+                    operator.gt,
+                    itertools.compress(column, self.columns[exclude]),
+                    itertools.repeat(value)
+                ))
+
+            return higher+1
+
+        higher = self.get_column(name) > value
+        if exclude:
+            higher &= self.get_column(exclude) == 0
+
+        return int(numpy.count_nonzero(higher))+1
+
+
+    def get_histogram(self, name:str, edges:List["int | float"]) -> List[int]:
+        '''
+        Returns the amount of users with the column value
+        from `edges[i]` inclusive to `edges[i+1]` exclusive
+        for every pair of neighbouring edges.
+        '''
+        if numpy == None:
+            values: List[Any] = sorted(self.columns[name])
+            places: List[int] = [bisect.bisect_left(values, i) for i in edges]
+        else:
+            places = numpy.searchsorted(
+                numpy.sort(self.get_column(name)), edges
+            ).tolist()
+
+        return [end-start for start, end in zip(places, places[1:])]
@@ -13,4 +13,35 @@ def events_to_text(username:str, events:List[dict]) -> str:
 
     # composing message
     text = f'{username} {", ".join(text_events)}!'
-    return text
\ No newline at end of file
+    return text
+
+# table that lowercases latin and cyrillic letters and turns ё into е
+GUESS_TABLE: Dict[int, str] = {
+    i: chr(i).lower() for i in [*range(0x250), *range(0x400, 0x530)]
+    if chr(i).lower() != chr(i) and len(chr(i).lower()) == 1
+}
+GUESS_TABLE.update({ord('ё'): 'е', ord('Ё'): 'е'})
+
+MAX_GUESS_PADDING: int = 16 # whitespace allowed around a guess
+
+
+def normalize(text:str) -> str:
+    '''
+    Brings the text to the form words are compared in.
+    '''
+    return text.translate(GUESS_TABLE)
+
+
+def is_guess(text:str, word:str) -> bool:
+    '''
+    Returns True if the message text is the normalized word.
+    '''
+    # long messages are rejected before anything is copied
+    if len(text) < len(word) or len(text) > len(word)+MAX_GUESS_PADDING:
+        return False
+
+    text = text.strip()
+    if len(text) != len(word):
+        return False
+
+    return text.translate(GUESS_TABLE) == word
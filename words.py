@@ -0,0 +1,425 @@
+import os
+import sys
+import mmap
+import glob
+import random
+import array
+import struct
+import hashlib
+import tempfile
+import collections.abc
+from typing import *
+
+
+# index file layout:
+#   header
+#   word offsets into the blob, uint32 * (word amount + 1)
+#   indexes of words without symbols, uint32 * filtered amount
+#   indexes of all words sorted by length, uint32 * word amount
+#   where each length starts in the above, uint32 * (max length + 2)
+#   indexes of words without symbols sorted by length, uint32 * filtered amount
+#   where each length starts in the above, uint32 * (max length + 2)
+#   blob of all words in utf-8, sorted bytewise
+
+MAGIC: bytes = b'CRWI'
+VERSION: int = 3
+HEADER = struct.Struct('<4sHHIIIqq32s') # magic, version, is little endian,
+                                        # word amount, filtered amount, max length,
+                                        # source mtime, source size, source hash
+
+
+def normalize(word:str) -> str:
+    '''
+    Brings the word to the form it's stored and compared in.
+    '''
+    return word.lower().replace('ё','е')
+
+
+def index_path(source_path:str) -> str:
+    '''
+    Returns the path of the index built from the word list.
+    '''
+    return f'{source_path}.idx'
+
+
+def get_source_key(source_path:str, raw:"bytes | None"=None) -> Tuple[int, int, bytes]:
+    '''
+    Returns the mtime, size and hash of the word list
+    the index is built from.
+    '''
+    if raw == None:
+        with open(source_path, 'rb') as f:
+            raw = f.read()
+
+    stat = os.stat(source_path)
+    return stat.st_mtime_ns, stat.st_size, hashlib.sha256(raw).digest()
+
+
+def bucket_by_length(
+    indexes:Iterable[int], lengths:List[int], max_length:int
+) -> Tuple[array.array, array.array]:
+    '''
+    Sorts word indexes by word length.
+
+    Returns the sorted indexes and where each length starts in them,
+    so words of length `n` are at `starts[n]` to `starts[n+1]`.
+    '''
+    buckets: List[List[int]] = [[] for _ in range(max_length+1)]
+    for i in indexes:
+        buckets[lengths[i]].append(i)
+
+    sorted_indexes = array.array('I')
+    starts = array.array('I')
+
+    for i in buckets:
+        starts.append(len(sorted_indexes))
+        sorted_indexes.extend(i)
+    starts.append(len(sorted_indexes))
+
+    return sorted_indexes, starts
+
+
+def build_index(source_path:str, path:str) -> int:
+    '''
+    Builds an index file from a word list.
+    Returns the amount of words in it.
+    '''
+    with open(source_path, 'rb') as f:
+        raw: bytes = f.read()
+
+    words: Set[str] = {
+        normalize(i) for i in raw.decode('utf-8').split('\n') if i != ''
+    }
+
+    encoded: List[bytes] = sorted([i.encode('utf-8') for i in words])
+
+    # offsets of every word in the blob
+    offsets = array.array('I', [0])
+    total: int = 0
+
+    for i in encoded:
+        total += len(i)
+        offsets.append(total)
+
+    # words without symbols
+    lengths: List[int] = [len(i.decode('utf-8')) for i in encoded]
+    filtered = array.array('I', [
+        n for n, i in enumerate(encoded) if i.decode('utf-8').isalpha()
+    ])
+
+    # words sorted by length
+    max_length: int = max(lengths, default=0)
+    by_length, length_starts = bucket_by_length(range(len(encoded)), lengths, max_length)
+    filtered_by_length, filtered_length_starts = bucket_by_length(filtered, lengths, max_length)
+
+    # writing
+    header: bytes = HEADER.pack(
+        MAGIC, VERSION, sys.byteorder == 'little',
+        len(encoded), len(filtered), max_length,
+        *get_source_key(source_path, raw)
+    )
+
+    # a unique temp file, so processes building
+    # the same index don't overwrite each other's
+    handle, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or '.',
+        prefix=os.path.basename(path)+'.', suffix='.tmp'
+    )
+
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            f.write(header)
+            f.write(offsets.tobytes())
+            f.write(filtered.tobytes())
+            f.write(by_length.tobytes())
+            f.write(length_starts.tobytes())
+            f.write(filtered_by_length.tobytes())
+            f.write(filtered_length_starts.tobytes())
+            f.write(b''.join(encoded))
+
+        os.replace(temp_path, path)
+    except:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return len(encoded)
+
+
+class WordList(collections.abc.Sequence):
+    def __init__(self, store:"WordStore", indexes:"memoryview | None"):
+        '''
+        A list of words from a word store.
+
+        Words are only decoded when accessed, so `random.choice`
+        on this list doesn't create a string for every word.
+        '''
+        self.store: WordStore = store
+        self.indexes: "memoryview | None" = indexes
+
+
+    def __len__(self) -> int:
+        if self.indexes == None:
+            return len(self.store)
+        return len(self.indexes)
+
+
+    def __getitem__(self, index:int) -> str:
+        if not isinstance(index, int):
+            raise TypeError('Word lists can only be indexed with integers')
+
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('Word index out of range')
+
+        if self.indexes == None:
+            return self.store.get(index)
+        return self.store.get(self.indexes[index])
+
+
+    def __contains__(self, word:str) -> bool:
+        if self.indexes == None:
+            return word in self.store
+        return word.isalpha() and word in self.store
+
+
+class WordStore:
+    def __init__(self, path:str):
+        '''
+        A memory-mapped word index built by `build_index`.
+
+        Raises ValueError if the file is not a valid index.
+        '''
+        self.path: str = path
+
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # reading header
+        try:
+            magic, version, little, amount, filtered_amount, self.max_length,\
+                self.source_mtime, self.source_size, self.source_hash =\
+                HEADER.unpack_from(self.map)
+        except struct.error:
+            raise ValueError(f'{path} is not a word index')
+
+        if magic != MAGIC or version != VERSION\
+            or bool(little) != (sys.byteorder == 'little'):
+                raise ValueError(f'{path} is an outdated word index')
+
+        # mapping sections
+        view = memoryview(self.map)
+        start: int = HEADER.size
+
+        self.offsets: memoryview = view[start:start+(amount+1)*4].cast('I')
+        start += (amount+1)*4
+
+        self.filtered: memoryview = view[start:start+filtered_amount*4].cast('I')
+        start += filtered_amount*4
+
+        # word length buckets
+        self.by_length: Dict[bool, memoryview] = {}
+        self.length_starts: Dict[bool, memoryview] = {}
+
+        for filtered, size in [(False, amount), (True, filtered_amount)]:
+            self.by_length[filtered] = view[start:start+size*4].cast('I')
+            start += size*4
+
+            self.length_starts[filtered] = view[start:start+(self.max_length+2)*4].cast('I')
+            start += (self.max_length+2)*4
+
+        self.blob_start: int = start
+
+        self.words = WordList(self, None)
+        self.filtered_words = WordList(self, self.filtered)
+
+
+    def __len__(self) -> int:
+        return len(self.offsets)-1
+
+
+    def is_built_from(self, source_path:str) -> bool:
+        '''
+        Returns True if the index was built from the current
+        contents of the word list.
+        '''
+        stat = os.stat(source_path)
+
+        # unchanged file, no need to read it
+        if stat.st_mtime_ns == self.source_mtime\
+            and stat.st_size == self.source_size:
+                return True
+
+        # the file was touched or copied but may be the same
+        if stat.st_size != self.source_size:
+            return False
+
+        return get_source_key(source_path)[2] == self.source_hash
+
+
+    def get_by_length(
+        self, filtered:bool, min_length:int, max_length:int
+    ) -> WordList:
+        '''
+        Returns the words with length from `min_length`
+        to `max_length` inclusive.
+        '''
+        min_length = min(max(min_length, 0), self.max_length+1)
+        max_length = min(max(max_length, min_length-1), self.max_length)
+
+        starts: memoryview = self.length_starts[filtered]
+
+        return WordList(self, self.by_length[filtered][
+            starts[min_length]:starts[max_length+1]
+        ])
+
+
+    def get_bytes(self, index:int) -> bytes:
+        '''
+        Returns the encoded word by its index.
+        '''
+        return self.map[
+            self.blob_start+self.offsets[index]:
+            self.blob_start+self.offsets[index+1]
+        ]
+
+
+    def get(self, index:int) -> str:
+        '''
+        Returns the word by its index.
+        '''
+        return self.get_bytes(index).decode('utf-8')
+
+
+    def __contains__(self, word:str) -> bool:
+        # binary search over the sorted blob
+        key: bytes = word.encode('utf-8')
+        low: int = 0
+        high: int = len(self)
+
+        while low < high:
+            middle: int = (low+high)//2
+
+            if self.get_bytes(middle) < key:
+                low = middle+1
+            else:
+                high = middle
+
+        return low < len(self) and self.get_bytes(low) == key
+
+
+# shuffle bag
+
+MASK_64: int = (1 << 64)-1
+
+def mix(value:int) -> int:
+    '''
+    Scrambles a 64-bit integer (splitmix64 finalizer).
+    '''
+    value = (value+0x9E3779B97F4A7C15) & MASK_64
+    value = ((value ^ (value >> 30))*0xBF58476D1CE4E5B9) & MASK_64
+    value = ((value ^ (value >> 27))*0x94D049BB133111EB) & MASK_64
+    return value ^ (value >> 31)
+
+
+class ShuffleBag:
+    def __init__(self, seed:int=0, index:int=0, size:int=0):
+        '''
+        Hands out every index below `size` once in a random order,
+        then reshuffles.
+
+        The order is computed from the seed, so the whole bag is saved
+        as just the seed, the amount of drawn indexes and the size.
+        '''
+        self.seed: int = seed
+        self.index: int = index
+        self.size: int = size
+        self.update_keys()
+
+
+    def update_keys(self):
+        '''
+        Derives the permutation settings from the seed and size.
+        '''
+        self.bits: int = max(2, (self.size-1).bit_length())
+        self.mask: int = (1 << self.bits)-1
+        self.shift: int = self.bits//2
+
+        self.keys: List[int] = []
+        key: int = self.seed
+
+        for _ in range(3):
+            key = mix(key)
+            self.keys.append(key)
+
+
+    def permute(self, index:int) -> int:
+        '''
+        Maps an index to its place in the shuffled order.
+
+        Multiplying by an odd number, adding and xorshifting are all
+        reversible modulo a power of two, so together they shuffle
+        `[0, 2^bits)`. Results past `size` are shuffled again until they
+        fit, which takes less than two rounds on average.
+        '''
+        while True:
+            for key in self.keys:
+                index = (index*(key | 1)+(key >> 32)) & self.mask
+                index ^= index >> self.shift
+
+            if index < self.size:
+                return index
+
+
+    def draw(self, size:int) -> int:
+        '''
+        Returns the next index below `size`.
+
+        Reshuffles if the bag is empty or the size has changed.
+        '''
+        if self.index >= self.size or size != self.size:
+            self.seed = random.getrandbits(64)
+            self.index = 0
+            self.size = size
+            self.update_keys()
+
+        index: int = self.permute(self.index)
+        self.index += 1
+
+        return index
+
+
+    def to_list(self) -> List[int]:
+        return [self.seed, self.index, self.size]
+
+
+def open_index(source_path:str) -> WordStore:
+    '''
+    Opens the index of a word list.
+    Builds it first if it's missing or the list has changed.
+    '''
+    path: str = index_path(source_path)
+
+    if os.path.exists(path):
+        try:
+            store = WordStore(path)
+            if store.is_built_from(source_path):
+                return store
+        except ValueError:
+            pass
+
+    build_index(source_path, path)
+    return WordStore(path)
+
+
+# usage: python words.py [word lists...]
+# builds indexes for the passed lists or every list in the lang folder
+if __name__ == '__main__':
+    from config import LANG_FOLDER
+
+    paths: List[str] = sys.argv[1:] or sorted(glob.glob(f'{LANG_FOLDER}*.txt'))
+
+    for i in paths:
+        amount: int = build_index(i, index_path(i))
+        print(f'Built {index_path(i)} with {amount} words')